@@ -0,0 +1,79 @@
+# Measures how long it takes to construct Blocks, for the kinds of Blocks that screens are built from. Every timed run
+# constructs --count Blocks of a scenario into a fresh Scene.
+# The results are written as JSON; pass --baseline with a previous result to fail on regressions.
+# Run it from the repository's root with: python -m benchmarks.block_construction [--count N] [--repeats N]
+
+import sys, argparse
+
+from benchmarks.harness import *
+
+WINDOW = init_headless()
+
+from data.scripts.pygameblock import *
+
+COUNT = 1000
+REPEATS = 5
+FONT = pygame.font.Font(None, 24)
+IMAGE = pygame.Surface((64, 64))
+
+# Each scenario constructs one Block the way a screen would, with parent being a Block to anchor it to.
+SCENARIOS = {
+    "label": lambda parent: Block(
+        parent = parent,
+        size = (200, 30),
+        anchor = Anchor(0.5, 0.5, 0, 0),
+        y = 10,
+        fg_text = "Label",
+        fg_font = FONT,
+        fg_color = WHITE,
+        update_appearance = True),
+    "enterbox": lambda parent: Block(
+        parent = parent,
+        size = (100, 50),
+        position = (-75, 25),
+        bg_color = pygame.Color("#009bb3"),
+        bd_color = pygame.Color("#40daf2"),
+        bd_thick = 4,
+        fg_text = "1",
+        fg_font = FONT,
+        fg_color = WHITE,
+        is_button = True,
+        button_type = Block.BUTTON_ENTER,
+        enter_type = Block.ENTER_NUMERIC,
+        fg_text_limit = 2,
+        command = lambda: None),
+    "image_button": lambda parent: Block(
+        parent = parent,
+        im_surface = IMAGE,
+        bg_color = pygame.Color("#00b1cc"),
+        is_button = True,
+        command = lambda: None),
+}
+
+def measure(construct, count: int, repeats: int):
+    roots = []
+    # Every run starts from a new Scene with a single root Block, untimed; the one before it is destroyed.
+    def reset():
+        if roots: roots[0].scene.destroy()
+        roots[:] = [Block(scene = Scene(), size = WINDOW_SIZE)]
+    def construct_all():
+        for _ in range(count): construct(roots[0])
+    metrics = summarize(sample(construct_all, repeats, setup = reset))
+    roots[0].scene.destroy()
+    metrics["us_per_block"] = metrics["median_ms"] / count * 1e3
+    return metrics
+
+def main():
+    parser = argparse.ArgumentParser(description = "Block construction benchmark")
+    parser.add_argument("--count", type = int, default = COUNT, help = "Blocks constructed per timed run")
+    parser.add_argument("--repeats", type = int, default = REPEATS, help = "Timed runs per scenario, within a time budget")
+    add_arguments(parser)
+    options = parser.parse_args()
+
+    metrics = {"count": options.count}
+    for name, construct in SCENARIOS.items():
+        for key, value in measure(construct, options.count, options.repeats).items(): metrics[f"{name}_{key}"] = value
+    sys.exit(report("block_construction", metrics, options))
+
+if __name__ == "__main__":
+    main()
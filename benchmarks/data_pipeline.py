@@ -0,0 +1,101 @@
+# Measures the vocabulary data path on synthetic catalogs of 1k to 100k subjects, shaped like the API's:
+# - decoding the JSON of the subject pages
+# - subject_fields and json_to_obj, which sort every subject's readings and meanings and intern them into ITEMS
+# - the filter and shuffle that Layout.receive_vocabulary applies to every arriving page
+# - writing the subjects to the SQLite store and reading them back
+# - exporting them to a snapshot and reading them back out of it
+# - the memory each Item costs, including its share of ITEMS
+# The results are written as JSON; pass --baseline with a previous result to fail on regressions.
+# Run it from the repository's root with: python -m benchmarks.data_pipeline [--sizes 1000 10000 100000]
+
+import sys, json, argparse, tracemalloc
+from random import Random
+
+from benchmarks.harness import *
+from benchmarks.stub_server import TYPES, subject
+
+SANDBOX = make_sandbox("data_pipeline_")
+
+from data.scripts import vocabwk
+from data.scripts.vocabwk import *
+
+SIZES = [1000, 10000, 100000]
+REPEATS = 5
+PAGE_SIZE = 1000 # Subjects per page, as the API returns them
+LEVELS = 60
+API_BASE = "https://api.wanikani.com/v2/"
+
+# The JSON of the pages the API would return for a catalog of count subjects, spread over every level and both types.
+def make_pages(count: int):
+    subjects = [subject(id, TYPES[id % len(TYPES)], id % LEVELS + 1, API_BASE) for id in range(1, count + 1)]
+    return [json.dumps({"object": "collection", "data": subjects[i:i + PAGE_SIZE], "pages": {"next_url": None}})
+            for i in range(0, count, PAGE_SIZE)]
+
+def fresh_items():
+    vocabwk.ITEMS = ItemTable()
+
+# The bytes still allocated after turning every subject into an Item in an empty ITEMS, per Item.
+def item_memory(subjects: list):
+    fresh_items()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    items = [json_to_obj(v) for v in subjects]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del items
+    return (after - before) / len(subjects)
+
+def measure(count: int, repeats: int):
+    metrics = {}
+    pages = make_pages(count)
+    subjects = [v for page in pages for v in json.loads(page)["data"]]
+    metrics["payload_bytes"] = sum(len(page.encode("utf-8")) for page in pages)
+
+    metrics.update(summarize(sample(lambda: [json.loads(page) for page in pages], repeats), "json_decode_"))
+    metrics.update(summarize(sample(lambda: [subject_fields(v) for v in subjects], repeats), "subject_fields_"))
+    metrics.update(summarize(sample(lambda: [json_to_obj(v) for v in subjects], repeats, setup = fresh_items), "json_to_obj_"))
+
+    # The same filter and shuffle as Layout.receive_vocabulary, over the whole catalog arriving as one deck.
+    fresh_items()
+    items = [json_to_obj(v) for v in subjects]
+    generator = Random(count)
+    def filter_and_shuffle():
+        vocabulary = [v for v in items if v.audio_url]
+        generator.shuffle(vocabulary)
+    metrics.update(summarize(sample(filter_and_shuffle, repeats), "filter_shuffle_"))
+
+    metrics["item_bytes"] = item_memory(subjects)
+
+    levels = [(type, level) for type in TYPES for level in range(1, LEVELS + 1)]
+    store = SubjectStore(os.path.join(SANDBOX, "data", f"pipeline_{count}.db"))
+    metrics.update(summarize(sample(lambda: store.put(subjects), repeats), "store_put_"))
+    metrics.update(summarize(sample(lambda: [store.subjects(type, [level]) for type, level in levels], repeats), "store_read_"))
+    store.connection.close()
+
+    path = os.path.join(SANDBOX, "data", f"pipeline_{count}.snapshot")
+    records = {(type, level): [] for type, level in levels}
+    for v in subjects: records[(v["object"], v["data"]["level"])].append(subject_fields(v))
+    metrics.update(summarize(sample(lambda: write_snapshot(path, records), repeats), "snapshot_write_"))
+    snapshot = open_snapshot(path)
+    metrics.update(summarize(sample(lambda: [snapshot.level(type, level) for type, level in levels], repeats), "snapshot_read_"))
+    snapshot.close()
+
+    for key in ["json_decode", "json_to_obj", "snapshot_read"]:
+        metrics[f"{key}_us_per_subject"] = metrics[f"{key}_median_ms"] / count * 1e3
+    fresh_items()
+    return metrics
+
+def main():
+    parser = argparse.ArgumentParser(description = "Vocabulary data pipeline benchmark")
+    parser.add_argument("--sizes", type = int, nargs = "+", default = SIZES, help = "Subjects in the synthetic catalogs")
+    parser.add_argument("--repeats", type = int, default = REPEATS, help = "Timed runs per case, within a time budget")
+    add_arguments(parser)
+    options = parser.parse_args()
+
+    metrics = {}
+    for count in options.sizes:
+        for key, value in measure(count, options.repeats).items(): metrics[f"{count}/{key}"] = value
+    sys.exit(report("data_pipeline", metrics, options))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# Helpers shared by the benchmarks: a headless pygame setup, timing statistics, and machine-readable results that can
+# be compared against a baseline to catch regressions.
+
+import os, sys, json, time, shutil, atexit, platform, tempfile
+
+# pygame (and the mixer that pygametools starts on import) has to be pointed at the dummy drivers before it is imported.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WINDOW_SIZE = (800, 600)
+REGRESSION_TOLERANCE = 0.2 # How much slower than the baseline a timing may be before it counts as a regression.
+FONT = "K Gothic.ttf"      # The quizzer's font, which is not distributed with the repository
+
+def init_headless(window_size: tuple = WINDOW_SIZE):
+    pygame.init()
+    return pygame.display.set_mode(window_size)
+
+# The modules under data.scripts keep their state (the subject store, the snapshot and the audio cache) next to
+# sys.argv[0], so this points it into a temporary copy of the data directory, which is deleted on exit. It has to be
+# called before any of them are imported. Resources are linked rather than copied where possible, and pygame's default
+# font stands in for the quizzer's if it is missing. Returns the sandbox's path.
+def make_sandbox(prefix: str = "benchmark_"):
+    sandbox = tempfile.mkdtemp(prefix = prefix)
+    atexit.register(shutil.rmtree, sandbox, True)
+    resources = os.path.join(REPOSITORY, "data", "resources")
+    fonts = os.path.join(sandbox, "data", "resources", "fonts")
+    os.makedirs(fonts)
+    for name in os.listdir(resources):
+        if name != "fonts": link(os.path.join(resources, name), os.path.join(sandbox, "data", "resources", name))
+    for name in os.listdir(os.path.join(resources, "fonts")):
+        link(os.path.join(resources, "fonts", name), os.path.join(fonts, name))
+    if not os.path.exists(os.path.join(fonts, FONT)):
+        print(f"{FONT} not found, using pygame's default font in its place", file = sys.stderr)
+        shutil.copyfile(os.path.join(os.path.dirname(pygame.__file__), pygame.font.get_default_font()), os.path.join(fonts, FONT))
+    sys.argv[0] = os.path.join(sandbox, "main.py")
+    return sandbox
+
+def link(source: str, destination: str):
+    try:
+        os.symlink(source, destination)
+    except OSError:
+        if os.path.isdir(source): shutil.copytree(source, destination)
+        else: shutil.copyfile(source, destination)
+
+# Calls a function until it has been timed count times, or until the time budget in seconds runs out after at least
+# minimum calls, and returns the durations in seconds. setup is called untimed before each call.
+def sample(function, count: int, budget: float = 2.0, minimum: int = 3, setup = None):
+    samples = []
+    deadline = time.perf_counter() + budget
+    while len(samples) < count and (len(samples) < minimum or time.perf_counter() < deadline):
+        if setup: setup()
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def percentile(ordered: list, fraction: float):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+# Summarizes durations in seconds as milliseconds.
+def summarize(samples: list, prefix: str = ""):
+    ordered = sorted(samples)
+    return {
+        f"{prefix}samples": len(ordered),
+        f"{prefix}min_ms": ordered[0] * 1e3,
+        f"{prefix}median_ms": percentile(ordered, 0.5) * 1e3,
+        f"{prefix}p95_ms": percentile(ordered, 0.95) * 1e3,
+        f"{prefix}p99_ms": percentile(ordered, 0.99) * 1e3,
+        f"{prefix}max_ms": ordered[-1] * 1e3,
+        f"{prefix}mean_ms": sum(ordered) / len(ordered) * 1e3}
+
+def metadata(benchmark: str):
+    return {
+        "benchmark": benchmark,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "sdl": ".".join(str(part) for part in pygame.get_sdl_version()),
+        "platform": platform.platform()}
+
+# Returns the regressions of the metrics against a baseline: the median timings that got slower than the tolerance allows.
+def regressions(metrics: dict, baseline: dict, tolerance: float = REGRESSION_TOLERANCE):
+    found = []
+    for key, value in metrics.items():
+        if not key.endswith("median_ms") or key not in baseline: continue
+        if value > baseline[key] * (1 + tolerance): found.append((key, baseline[key], value))
+    return found
+
+# Adds the command line options shared by every benchmark to an argparse parser.
+def add_arguments(parser):
+    parser.add_argument("--output", help = "Write the results to this JSON file instead of standard output")
+    parser.add_argument("--baseline", help = "A previous JSON result to compare against; regressions make the exit code 1")
+    parser.add_argument("--tolerance", type = float, default = REGRESSION_TOLERANCE, help = "Allowed slowdown against the baseline, as a fraction")
+
+# Writes the results as JSON and compares them to the baseline, if any. Returns the process exit code.
+def report(benchmark: str, metrics: dict, options):
+    results = {"meta": metadata(benchmark), "metrics": metrics}
+    text = json.dumps(results, indent = 2)
+    if options.output:
+        with open(options.output, "w") as f: f.write(text + "\n")
+    else:
+        print(text)
+
+    if not options.baseline: return 0
+    with open(options.baseline) as f: baseline = json.load(f)["metrics"]
+    found = regressions(metrics, baseline, options.tolerance)
+    for key, before, after in found: print(f"REGRESSION {key}: {before:.3f} ms -> {after:.3f} ms", file = sys.stderr)
+    return 1 if found else 0
@@ -0,0 +1,117 @@
+# Drives the quizzer's Layout headlessly through whole quizzes and measures how long each action takes to show up:
+# - first_question_cold: Space, with nothing stored yet, until the first question is rendered
+# - first_question_warm: Space, on a range that was quizzed before, until the first question is rendered
+# - reveal:              Right, until the answer is rendered
+# - advance:             Up or Down, until the next question (or the end of the quiz) is rendered
+# - undo:                Z, until the previous answer is rendered again
+# - mode_switch:         Tab, until the new mode's title is rendered
+# An action counts as done at the end of the first frame after which the Layout is in the expected state and nothing
+# is left to render. Subjects and audio are served by a local stub of the API (see stub_server.py), and the store,
+# snapshot and audio cache are kept in a sandbox (see harness.make_sandbox), so every run starts from the same cold state.
+# Run it from the repository's root with: python -m benchmarks.quiz_latency [--rounds N] [--levels N] [--delay MS]
+
+import sys, time, argparse
+from random import Random, seed
+
+from benchmarks.harness import *
+from benchmarks.stub_server import StubServer
+
+ROUNDS = 3
+LEVELS = 1
+SUBJECTS_PER_LEVEL = 40
+MISTAKE_RATE = 0.1 # The share of answers that are marked wrong, so that quizzes go through mistake phases as well
+UNDO_RATE = 0.1    # The share of advances that are undone and answered again
+TIMEOUT = 30.0     # Seconds an action may take before the run is aborted
+NOWHERE = (-1, -1)
+
+SANDBOX = make_sandbox("quiz_latency_")
+
+pygame.init()
+
+from data.scripts import vocabwk
+from data.scripts.vocablayout import *
+
+WINDOW = pygame.display.set_mode(WINDOW_SIZE)
+
+class QuizDriver:
+    def __init__(self, fps: int = 0):
+        self.clock = pygame.time.Clock() if fps else None
+        self.fps = fps
+        self.layout = Layout()
+        initiate_blocks(WINDOW, COLOR_BG_MAIN)
+        self.frame()
+        self.samples = {}
+
+    # Runs one frame the way App.loop does, with the given keys pressed.
+    def frame(self, keys: tuple = ()):
+        events = [pygame.event.Event(KEYDOWN, key = key, unicode = "") for key in keys]
+        refresh_rects = render_upate_blocks(WINDOW, IO_State(NOWHERE, False, False, events))
+        pygame.display.update(refresh_rects)
+        if self.clock: self.clock.tick(self.fps)
+        # Leave the loading threads some room while the Layout is only waiting on them.
+        elif not refresh_rects: time.sleep(0.001)
+
+    def settled(self):
+        scene = active_scene()
+        return not scene.render_queue and not scene.dirty_regions and not scene.full_repaint
+
+    # Presses a key and runs frames until done(layout) holds and everything has been rendered, recording the time it took.
+    def act(self, action: str, key: int, done):
+        start = time.perf_counter()
+        self.frame((key,))
+        while not (done(self.layout) and self.settled()):
+            if time.perf_counter() - start > TIMEOUT: raise TimeoutError(f"{action} did not finish within {TIMEOUT} seconds")
+            self.frame()
+        self.samples.setdefault(action, []).append(time.perf_counter() - start)
+
+    # Plays one quiz from start to finish, answering with the given random generator.
+    def quiz(self, first_question: str, generator: Random):
+        self.act(first_question, K_SPACE, lambda layout: layout.state.state in [STATE_QUESTION, STATE_IDLE])
+        while self.layout.state.state != STATE_IDLE:
+            self.act("reveal", K_RIGHT, lambda layout: layout.state.state == STATE_ANSWER)
+            self.advance(generator)
+            state = self.layout.state
+            if state.state == STATE_QUESTION and (state.vocabulary_index > 0 or state.phase > 1) and generator.random() < UNDO_RATE:
+                self.act("undo", K_z, lambda layout: layout.state.state == STATE_ANSWER)
+                self.advance(generator)
+
+    def advance(self, generator: Random):
+        key = K_DOWN if generator.random() < MISTAKE_RATE else K_UP
+        self.act("advance", key, lambda layout: layout.state.state in [STATE_QUESTION, STATE_IDLE])
+
+    # Cycles through every mode back to the one the quiz was in.
+    def switch_modes(self):
+        for _ in modes:
+            mode = (self.layout.mode + 1) % len(modes)
+            self.act("mode_switch", K_TAB, lambda layout: layout.mode == mode)
+
+def main():
+    parser = argparse.ArgumentParser(description = "Headless end-to-end quiz latency benchmark")
+    parser.add_argument("--rounds", type = int, default = ROUNDS, help = "Quizzes played; only the first one starts cold")
+    parser.add_argument("--levels", type = int, default = LEVELS, help = "Levels in every quiz, starting from level 1")
+    parser.add_argument("--subjects", type = int, default = SUBJECTS_PER_LEVEL, help = "Subjects of each type per level")
+    parser.add_argument("--delay", type = float, default = 0.0, help = "Milliseconds the stub server waits before every response")
+    parser.add_argument("--fps", type = int, default = 0, help = "Pace frames like the application does; 0 runs them back to back")
+    parser.add_argument("--seed", type = int, default = 0, help = "Seed of the shuffles and answers")
+    add_arguments(parser)
+    options = parser.parse_args()
+
+    server = StubServer(subjects_per_level = options.subjects, delay = options.delay / 1e3).start()
+    vocabwk.BASE = server.base
+    seed(options.seed) # The Layout shuffles its decks with the random module
+    generator = Random(options.seed)
+
+    driver = QuizDriver(options.fps)
+    # Typed in directly rather than entered, which would start loading the range ahead of the cold start.
+    driver.layout.level_upper_enterbox.set_all_fg_text(str(options.levels))
+    for round in range(options.rounds):
+        driver.quiz("first_question_warm" if round else "first_question_cold", generator)
+        driver.switch_modes()
+    server.stop()
+
+    metrics = {"rounds": options.rounds, "levels": options.levels, "requests": server.requests}
+    for action, samples in driver.samples.items(): metrics.update(summarize(samples, f"{action}_"))
+    sys.exit(report("quiz_latency", metrics, options))
+
+if __name__ == "__main__":
+    main()
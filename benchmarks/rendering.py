@@ -0,0 +1,136 @@
+# Measures what the pygameblock widget engine costs on synthetic screens of 10 to 5000 Blocks, headlessly:
+# - construction time
+# - initiate_blocks and render_all time
+# - steady-state render_upate_blocks frame time, with a varying share of the Blocks requesting a render every frame
+# - hover dispatch time, with the mouse moving across the window
+# The results are written as JSON; pass --baseline with a previous result to fail on regressions.
+# Run it from the repository's root with: python -m benchmarks.rendering [--sizes 10 100 1000 5000]
+
+import sys, math, time, random, argparse
+
+from benchmarks.harness import *
+
+WINDOW = init_headless()
+
+from data.scripts.pygameblock import *
+
+SIZES = [10, 100, 1000, 5000]
+DIRTY_RATIOS = [0.0, 0.01, 0.1, 1.0]
+FRAMES = 60
+HOVER_STEPS = 200
+BLOCKS_PER_PANEL = 5
+BACKGROUND = pygame.Color("#00b1cc")
+NOWHERE = (-1, -1) # A mouse position outside of the window, so that no Block is hovered
+
+# Builds a screen of about count Blocks into the active Scene: a grid of bordered panels, each with a label, an image
+# and a button anchored inside it, and a caption anchored inside the button. Returns every Block that was created.
+def build_scene(count: int):
+    panels = max(1, count // BLOCKS_PER_PANEL)
+    columns = math.ceil(math.sqrt(panels * WINDOW_SIZE[0] / WINDOW_SIZE[1]))
+    rows = math.ceil(panels / columns)
+    w, h = max(4, WINDOW_SIZE[0] // columns), max(4, WINDOW_SIZE[1] // rows)
+    font = pygame.font.Font(None, max(8, h // 4))
+    image = pygame.Surface((max(1, w // 3), max(1, h // 3)))
+    image.fill(pygame.Color("#8800cc"))
+
+    blocks = []
+    for i in range(panels):
+        panel = Block(
+            position = ((i % columns) * w, (i // columns) * h),
+            size = (w, h),
+            bg_color = pygame.Color("#009bb3"),
+            bd_color = pygame.Color("#40daf2"),
+            bd_thick = 1,
+            update_appearance = True)
+        label = Block(
+            parent = panel,
+            size = (w, h // 4),
+            anchor = Anchor(0.5, 0.5, 0, 0),
+            fg_text = str(i),
+            fg_font = font,
+            fg_color = WHITE,
+            update_appearance = True)
+        picture = Block(
+            parent = panel,
+            im_surface = image,
+            anchor = Anchor(0, 0, 1, 1),
+            update_appearance = True)
+        button = Block(
+            parent = panel,
+            size = (w // 2, h // 3),
+            anchor = Anchor(1, 1, 1, 1),
+            bg_color = pygame.Color("#00cc44"),
+            bd_thick = 1,
+            is_button = True,
+            command = lambda: None)
+        caption = Block(
+            parent = button,
+            size = (w // 2, h // 3),
+            anchor = Anchor(0.5, 0.5, 0.5, 0.5),
+            fg_text = "ok",
+            fg_font = font,
+            update_appearance = True)
+        blocks += [panel, label, picture, button, caption]
+    return blocks
+
+def frame(position: tuple = NOWHERE):
+    return render_upate_blocks(WINDOW, IO_State(position))
+
+# Measures a screen of about count Blocks in a Scene of its own, which is destroyed afterwards, and the Scene that was
+# active before is made active again.
+def measure(count: int, frames: int):
+    metrics = {}
+    previous = active_scene()
+    scene = Scene()
+    set_active_scene(scene)
+
+    start = time.perf_counter()
+    blocks = build_scene(count)
+    elapsed = time.perf_counter() - start
+    metrics["blocks"] = len(blocks)
+    metrics["construction_ms"] = elapsed * 1e3
+    metrics["construction_us_per_block"] = elapsed / len(blocks) * 1e6
+
+    start = time.perf_counter()
+    initiate_blocks(WINDOW, BACKGROUND)
+    metrics["initiate_blocks_ms"] = (time.perf_counter() - start) * 1e3
+    frame()
+
+    metrics.update(summarize(sample(lambda: render_all(WINDOW, BACKGROUND), frames), "render_all_"))
+
+    # The same random Blocks are made dirty in every run, so that the results are comparable.
+    generator = random.Random(count)
+    for ratio in DIRTY_RATIOS:
+        dirty = generator.sample(blocks, round(len(blocks) * ratio))
+        def make_dirty():
+            for block in dirty: block.request_render()
+        metrics.update(summarize(sample(frame, frames, setup = make_dirty), f"frame_dirty_{ratio:g}_"))
+
+    # Sweep the mouse diagonally across the window, timing only the dispatch. The Blocks it hovered and left are
+    # rendered untimed before the next step.
+    path = [(WINDOW_SIZE[0] * i // HOVER_STEPS, WINDOW_SIZE[1] * i // HOVER_STEPS) for i in range(HOVER_STEPS)]
+    steps = iter(path * 2)
+    position = [NOWHERE]
+    def next_position():
+        frame(position[0])
+        position[0] = next(steps)
+    metrics.update(summarize(sample(lambda: dispatch_io(IO_State(position[0])), HOVER_STEPS, setup = next_position), "hover_dispatch_"))
+
+    scene.destroy()
+    set_active_scene(previous)
+    return metrics
+
+def main():
+    parser = argparse.ArgumentParser(description = "Headless pygameblock rendering benchmark")
+    parser.add_argument("--sizes", type = int, nargs = "+", default = SIZES, help = "Approximate Block counts of the scenes")
+    parser.add_argument("--frames", type = int, default = FRAMES, help = "Frames measured per case, within a time budget")
+    add_arguments(parser)
+    options = parser.parse_args()
+
+    metrics = {}
+    for count in options.sizes:
+        for key, value in measure(count, options.frames).items(): metrics[f"{count}/{key}"] = value
+    sys.exit(report("rendering", metrics, options))
+
+if __name__ == "__main__":
+    main()
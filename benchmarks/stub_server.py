@@ -0,0 +1,117 @@
+# A local stand-in for the parts of the WaniKani API that the quizzer uses: paginated /subjects queries filtered by
+# type, level and updated_after (with ETags, so that conditional syncs get 304s), and pronunciation clips.
+# The subjects are generated deterministically, so every run sees the same catalog.
+
+import io, json, wave, time, hashlib, threading, http.server
+from urllib.parse import urlparse, parse_qs, urlencode
+
+TYPES = ['kanji', 'vocabulary']
+UPDATED_AT = '2020-01-01T00:00:00.000000Z'
+
+# A short silent clip that pygame's mixer can decode, served for every pronunciation.
+def silent_clip(seconds: float = 0.2, rate: int = 22050):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as clip:
+        clip.setnchannels(1)
+        clip.setsampwidth(2)
+        clip.setframerate(rate)
+        clip.writeframes(b'\0\0' * int(seconds * rate))
+    return buffer.getvalue()
+
+# The raw JSON of a subject, shaped like the API's.
+def subject(id: int, type: str, level: int, base: str):
+    return {
+        'id': id,
+        'object': type,
+        'url': f'{base}subjects/{id}',
+        'data_updated_at': UPDATED_AT,
+        'data': {
+            'level': level,
+            'characters': chr(0x4E00 + id % 0x5000) * (1 if type == 'kanji' else 2),
+            'meanings': [{'meaning': f'meaning {id}', 'primary': True, 'accepted_answer': True},
+                         {'meaning': f'alternative {id}', 'primary': False, 'accepted_answer': True}],
+            'readings': [{'reading': 'よみ', 'primary': False, 'accepted_answer': True},
+                         {'reading': 'かな', 'primary': True, 'accepted_answer': True}],
+            'pronunciation_audios': [] if type == 'kanji' else [
+                {'url': f'{base}audio/{id}.mp3', 'content_type': 'audio/mpeg', 'metadata': {}},
+                {'url': f'{base}audio/{id}.ogg', 'content_type': 'audio/ogg', 'metadata': {}}]}}
+
+# - levels:             The levels in the catalog
+# - subjects_per_level: How many subjects of each type every level has
+# - page_size:          The most subjects returned by one page
+# - delay:              Seconds every request waits before being answered, standing in for network latency
+class StubServer:
+    def __init__(self, levels: int = 60, subjects_per_level: int = 40, page_size: int = 1000, delay: float = 0.0):
+        self.page_size = page_size
+        self.delay = delay
+        self.clip = silent_clip()
+        self.requests = 0
+        self.lock = threading.Lock()
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), self.handler())
+        self.server.daemon_threads = True
+        self.base = f'http://127.0.0.1:{self.server.server_port}/'
+
+        self.subjects = []
+        for type in TYPES:
+            for level in range(1, levels + 1):
+                for i in range(subjects_per_level):
+                    self.subjects.append(subject(len(self.subjects) + 1, type, level, self.base))
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # The subjects matching a query, in id order.
+    def query(self, parameters: dict):
+        def values(key): return [value for values in parameters.get(key, []) for value in values.split(',')]
+        types, levels, updated_after = values('types'), [int(level) for level in values('levels')], values('updated_after')
+        return [s for s in self.subjects
+                if (not types or s['object'] in types)
+                and (not levels or s['data']['level'] in levels)
+                and (not updated_after or s['data_updated_at'] > updated_after[0])]
+
+    def handler(self):
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True # Headers and body are written separately, which would otherwise stall keep-alive clients
+
+            def send(self, status: int, body: bytes = b'', headers: dict = {}):
+                self.send_response(status)
+                for key, value in headers.items(): self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                with stub.lock: stub.requests += 1
+                if stub.delay: time.sleep(stub.delay)
+                url = urlparse(self.path)
+                if url.path.startswith('/audio/'): return self.send(200, stub.clip, {'Content-Type': 'audio/ogg'})
+                if url.path != '/subjects': return self.send(404)
+
+                parameters = parse_qs(url.query)
+                matches = stub.query(parameters)
+                etag = '"' + hashlib.sha1(json.dumps([s['id'] for s in matches]).encode()).hexdigest() + '"'
+                if self.headers.get('If-None-Match') == etag: return self.send(304, headers = {'ETag': etag})
+
+                page = int(parameters.get('page', ['0'])[0])
+                chunk = matches[page * stub.page_size:(page + 1) * stub.page_size]
+                next_url = None
+                if (page + 1) * stub.page_size < len(matches):
+                    query = {key: values[0] for key, values in parameters.items()}
+                    next_url = stub.base + 'subjects?' + urlencode({**query, 'page': page + 1})
+                body = {'object': 'collection', 'total_count': len(matches), 'data': chunk,
+                        'pages': {'per_page': stub.page_size, 'next_url': next_url}}
+                self.send(200, json.dumps(body).encode(), {'Content-Type': 'application/json', 'ETag': etag})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
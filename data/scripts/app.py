@@ -1,12 +1,19 @@
-import pygame, sys, time, win32gui, win32con
+import pygame, sys, time
 from pygame.locals import *
 
 from data.scripts.res import *
 from data.scripts.pygametools import *
 from data.scripts.pygameblock import *
+from data.scripts.pygameprofiler import *
 from data.scripts.vocablayout import *
 from data.scripts.vocabstyle import *
 
+# The Windows message queue is only available (and only needs pumping) on Windows.
+try:
+    import win32gui, win32con
+except ImportError:
+    win32gui = None
+
 LEFT_MOUSE = 1
 RIGHT_MOUSE = 2
 APP_INPUT_FOCUS = 2
@@ -14,38 +21,75 @@ APP_INPUT_FOCUS = 2
 WINDOW_FPS = 60
 WINDOW = pygame.display.set_mode(WINDOW_SIZE)
 
+EVENT_DRIVEN = True     # Sleep until the next event while there is nothing to do, instead of always running at WINDOW_FPS.
+IDLE_TIMEOUT = 1000     # The longest time in milliseconds that the loop sleeps for while idle.
+PLATFORM_TIMEOUT = 50   # The same, when a platform hook has to be called regularly.
+ACTIVE_LINGER = 0.25    # Seconds that the full frame rate is kept after the last frame with work, so that bursts of input stay smooth.
+PROFILE = False         # Show the frame profiler overlay from the start. PROFILER_KEY toggles it at any time.
+PROFILER_KEY = K_F3
+
+# This is required on Windows in order for code execution to continue while dragging the window around.
+def pump_windows_messages():
+    message_present, message = win32gui.PeekMessage(None, 0, 0, win32con.PM_REMOVE | win32con.PM_NOYIELD)
+    if message_present:
+        win32gui.TranslateMessage(message)
+        win32gui.DispatchMessage(message)
+
+PLATFORM_HOOK = pump_windows_messages if win32gui else None
+
 class App:
     def __init__(self):
 
         self.clock = pygame.time.Clock()
         self.window_surface = WINDOW
         pygame.display.set_caption(WINDOW_NAME)
-        pygame.event.set_allowed([QUIT, MOUSEBUTTONDOWN, MOUSEBUTTONUP, KEYDOWN, KEYUP])
+        pygame.event.set_allowed([QUIT, ACTIVEEVENT, MOUSEMOTION, MOUSEBUTTONDOWN, MOUSEBUTTONUP, KEYDOWN, KEYUP, WAKE_EVENT])
 
-        self.previous_time = time.perf_counter()
+        self.last_work_time = time.perf_counter()
         self.is_active = False
+        self.event_driven = EVENT_DRIVEN
+        self.platform_hook = PLATFORM_HOOK
 
         self.layout = Layout()
         initiate_blocks(self.window_surface, COLOR_BG_MAIN)
+        self.profiler = None
+        if PROFILE: self.toggle_profiler()
 
-        self.hwnd = pygame.display.get_wm_info()['window']
+        self.hwnd = pygame.display.get_wm_info().get('window')
 
         self.loop()
 
+    # Whether the loop should run at the full frame rate rather than wait for events.
+    def is_busy(self):
+        return not self.event_driven or has_pending_work() or time.perf_counter() - self.last_work_time < ACTIVE_LINGER
+
+    # Shows or hides the frame profiler overlay. It only takes effect from the next frame on.
+    def toggle_profiler(self):
+        if self.profiler:
+            self.profiler.close()
+            self.profiler = None
+        else:
+            self.profiler = FrameProfiler(WINDOW_SIZE)
+
+    # Returns this frame's events, first sleeping until one arrives if there is nothing else to do.
+    def wait_for_events(self):
+        if self.is_busy(): return pygame.event.get()
+        event = pygame.event.wait(PLATFORM_TIMEOUT if self.platform_hook else IDLE_TIMEOUT)
+        return ([event] if event.type != NOEVENT else []) + pygame.event.get()
+
     def loop(self):
         while True:
-            # This is required in order for code execution to continue while dragging the window around.
-            message_present, message = win32gui.PeekMessage(None, 0, 0, win32con.PM_REMOVE | win32con.PM_NOYIELD)
-            if message_present:
-                win32gui.TranslateMessage(message)
-                win32gui.DispatchMessage(message)
+            if self.platform_hook: self.platform_hook()
 
+            events = self.wait_for_events()
+            profiler = self.profiler
+            if profiler: profiler.begin_frame()
             mouse_position = pygame.mouse.get_pos() if self.is_active else (-1, -1)
             mouse_clicked = False
             mouse_released = False
             key_events = []
 
-            for event in pygame.event.get():
+            for event in events:
                 if event.type == QUIT:
                     pygame.quit()
                     sys.exit()
@@ -61,15 +105,23 @@ class App:
                 elif event.type == MOUSEBUTTONUP:
                     if event.button == LEFT_MOUSE:
                         mouse_released = True
+                elif event.type == KEYDOWN and event.key == PROFILER_KEY:
+                    self.toggle_profiler()
                 elif event.type == KEYDOWN:
                     key_events.append(event)
 
-            refresh_rects = render_upate_blocks(self.window_surface, IO_State(mouse_position, mouse_clicked, mouse_released, key_events))
+            io_state = IO_State(mouse_position, mouse_clicked, mouse_released, key_events)
+            if profiler:
+                profiler.mark("events")
+                refresh_rects = render_blocks(self.window_surface)
+                profiler.mark("render")
+                dispatch_io(io_state)
+                profiler.mark("update")
+            else:
+                refresh_rects = render_upate_blocks(self.window_surface, io_state)
 
-            current_time = time.perf_counter()
-            fps = 1.0 / (current_time - self.previous_time)
-            # if fps < 60: print("LOW FPS!!! " + str(fps))
-            self.previous_time = current_time
+            if events or refresh_rects: self.last_work_time = time.perf_counter()
 
             pygame.display.update(refresh_rects)
-            self.clock.tick(WINDOW_FPS)
\ No newline at end of file
+            if profiler: profiler.end_frame(refresh_rects)
+            self.clock.tick(WINDOW_FPS)
@@ -1,4 +1,4 @@
-import pygame, time
+import pygame, time, heapq, weakref
 from pygame.locals import *
 from dataclasses import dataclass, field
 from typing import List
@@ -15,10 +15,7 @@ DISABLED_DEFAULT_WHITENESS = 50
 STATE_IDLE = 0
 STATE_HOVER = 1
 STATE_HOLD = 2
-
-BLOCKS = []                  # An automatically-populated list of all Blocks.
-UPDATE_IO_BLOCKS = []        # An automatically-populated list of all Blocks whose update_io is True.
-UPDATE_APPEARANCE_BLOCKS = [] # An automatically-populated list of all Blocks whose update_appearance is True.
+STATE_DISABLED = 3 # Only used as a visual state; see Block.visual_state.
 
 # A way to package all of the current frame's input data.
 @dataclass
@@ -28,55 +25,429 @@ class IO_State:
     mouse_released: bool = False
     key_events: List[str] = field(default_factory=list)
 
+NO_IO_STATE = IO_State() # The last_io_state of every Block that has not been updated yet.
+
+BACKGROUND_DEFAULT = BLACK   # The color behind every Block, set by initiate_blocks.
+HIT_GRID_CELL_SIZE = 64
+MERGE_RECT_LIMIT = 256       # More dirty regions than this in one frame are repainted as the whole window instead.
+FULL_REPAINT_SHARE = 0.5     # Dirty regions adding up to this share of the window are repainted as the whole window instead.
+WAKE_EVENT = pygame.event.custom_type() # Posted by wake() to interrupt an application loop that is waiting for events.
+DEFAULT_FONT = None          # The font of Blocks created without one, loaded by default_font the first time it is needed.
+PROFILER = None              # While set (see set_profiler), the compositor has it time every Block's blit_sequence.
+LIVE_SCENES = {}             # Every Scene that has not been destroyed, as an ordered set. It keeps them alive for their Blocks.
+
+# A uniform grid over the rects of Blocks, so that finding the Blocks at a position or in an area only looks at the
+# cells it covers. The Scene keeps two: one over the global rects of the IO Blocks, which is rebuilt lazily whenever an
+# IO Block's transform has been invalidated, and one over the area every Block occupies on screen (see
+# Block.occupied_rect), in which only the Blocks that moved or were painted elsewhere are placed again.
+class HitGrid:
+    def __init__(self, cell_size: int = HIT_GRID_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}   # (cell x, cell y) -> the Blocks in the cell, as an ordered set
+        self.extents = {} # Block -> the range of cells it was placed in
+        self.dirty = True
+
+    def rebuild(self, blocks: list):
+        self.cells = {}
+        self.extents = {}
+        for block in blocks: self.place(block, block.global_rect)
+        self.dirty = False
+
+    def cell_range(self, rect: pygame.Rect):
+        return (rect.left // self.cell_size, (rect.right - 1) // self.cell_size + 1,
+                rect.top // self.cell_size, (rect.bottom - 1) // self.cell_size + 1)
+
+    # Puts a Block into the cells covered by a rect, taking it out of the ones it was in before.
+    def place(self, block, rect: pygame.Rect):
+        extent = self.cell_range(rect)
+        if self.extents.get(block) == extent: return
+        self.discard(block)
+        self.extents[block] = extent
+        for cell_x in range(extent[0], extent[1]):
+            for cell_y in range(extent[2], extent[3]):
+                self.cells.setdefault((cell_x, cell_y), {})[block] = None
+
+    def discard(self, block):
+        extent = self.extents.pop(block, None)
+        if extent is None: return
+        for cell_x in range(extent[0], extent[1]):
+            for cell_y in range(extent[2], extent[3]):
+                cell = self.cells[(cell_x, cell_y)]
+                del cell[block]
+                if not cell: del self.cells[(cell_x, cell_y)]
+
+    # Returns the Blocks whose rects may contain the position.
+    def at(self, position: tuple):
+        return self.cells.get((int(position[0]) // self.cell_size, int(position[1]) // self.cell_size), ())
+
+    # Returns the Blocks whose rects may overlap the rect.
+    def overlapping(self, rect: pygame.Rect):
+        left, right, top, bottom = self.cell_range(rect)
+        blocks = set()
+        for cell_x in range(left, right):
+            for cell_y in range(top, bottom):
+                cell = self.cells.get((cell_x, cell_y))
+                if cell: blocks.update(cell)
+        return blocks
+
+# A screen's worth of Blocks. The Scene owns its Blocks and everything the frame functions need about them, and only
+# the active Scene is rendered and receives input, so that building, swapping and destroying screens never costs the
+# other screens anything. A Block joins the Scene of its parent, or else the active Scene, and only keeps a weak
+# reference to it. A Scene is kept alive in LIVE_SCENES from its creation until it is destroyed, so Block(scene = Scene())
+# works without holding on to the Scene; call destroy once a Scene is no longer needed to free it and its Blocks.
+class Scene:
+    def __init__(self):
+        LIVE_SCENES[self] = None
+        self.blocks = {}                # All Blocks, in creation order. The dicts here are used as ordered sets.
+        self.io_blocks = {}             # All Blocks whose update_io is True.
+        self.active_io_blocks = set()   # IO Blocks that are hovered or held, and so may change state without the mouse over them.
+        self.always_io_blocks = set()   # IO Blocks that need every frame's input regardless of the mouse: tooltips, and Blocks overriding update.
+        self.hit_grid = HitGrid()
+        self.paint_grid = HitGrid()     # All Blocks, by the area they occupy on screen.
+        self.moved = set()              # Blocks whose place in the paint grid may be out of date.
+        self.render_queue = []          # A heap of (z_order, creation index, Block) for the Blocks flagged for rendering, each at most once.
+        self.dirty_regions = []         # Screen regions to repaint on the next frame, besides those of the Blocks flagged for rendering.
+        self.work_sources = []          # Weak references to functions returning whether something besides the Blocks needs frames.
+        self.ordered_blocks = None      # All Blocks in the order they are painted, rebuilt after Blocks are added or removed.
+        self.created = 0                # The number of Blocks ever added, which gives each Block its creation index.
+        self.full_repaint = False       # Whether the whole window has to be repainted on the next frame.
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+    def add(self, block):
+        block.scene_ref = weakref.ref(self)
+        block.creation_index = self.created
+        self.created += 1
+        self.blocks[block] = None
+        self.ordered_blocks = None
+        self.moved.add(block)
+        if block.update_io:
+            block.io_order = block.creation_index
+            self.io_blocks[block] = None
+            self.hit_grid.dirty = True
+            if block.is_tooltip or type(block).update is not Block.update: self.always_io_blocks.add(block)
+
+    # Removes a single Block, leaving the Blocks below it; see Block.destroy. A Block still waiting in the render queue
+    # is skipped when the queue is drained.
+    def remove(self, block):
+        if block not in self.blocks: return
+        del self.blocks[block]
+        self.paint_grid.discard(block)
+        self.moved.discard(block)
+        self.request_region_render(block.rendered_rect)
+        if block in self.io_blocks:
+            del self.io_blocks[block]
+            self.hit_grid.dirty = True
+        self.active_io_blocks.discard(block)
+        self.always_io_blocks.discard(block)
+        self.ordered_blocks = None
+        block.scene_ref = None
+
+    # Removes every Block, which can then be freed as soon as nothing else refers to them, and lets the Scene be freed.
+    def destroy(self):
+        for block in self.blocks: block.scene_ref = None
+        self.blocks.clear()
+        self.io_blocks.clear()
+        self.active_io_blocks.clear()
+        self.always_io_blocks.clear()
+        self.render_queue.clear()
+        self.dirty_regions.clear()
+        self.work_sources.clear()
+        self.hit_grid = HitGrid()
+        self.paint_grid = HitGrid()
+        self.moved.clear()
+        self.ordered_blocks = None
+        LIVE_SCENES.pop(self, None)
+        if ACTIVE_SCENE is self: self.full_repaint = True
+
+    def render_order(self):
+        if self.ordered_blocks is None: self.ordered_blocks = sorted(self.blocks, key=lambda block: block.z_order)
+        return self.ordered_blocks
+
+    # Returns the Blocks that occupy any of a rect's screen area, in the order they are painted. Only the Blocks that moved
+    # or were painted elsewhere since the last call are placed again, so the cost follows the Blocks near the rect
+    # rather than all of them.
+    def blocks_overlapping(self, rect: pygame.Rect):
+        for block in self.moved: self.paint_grid.place(block, block.occupied_rect)
+        self.moved.clear()
+        candidates = self.paint_grid.overlapping(rect)
+        # A region covering most of the Scene is cheaper to take out of the painting order than to sort.
+        if len(candidates) * 4 > len(self.blocks): candidates = [block for block in self.render_order() if block in candidates]
+        else: candidates = sorted(candidates, key=lambda block: (block.z_order, block.creation_index))
+        return [block for block in candidates
+                if block.global_rect.colliderect(rect) or (block.rendered_rect and block.rendered_rect.colliderect(rect))]
+
+    # Schedules a region of the screen to be repainted on the next frame.
+    def request_region_render(self, rect: pygame.Rect):
+        if rect: self.dirty_regions.append(pygame.Rect(rect))
+
+    # Registers a function returning whether something besides the Blocks needs frames, such as an animation or
+    # loading. A bound method is only weakly referenced, so that it never keeps its object alive.
+    def register_work_source(self, source):
+        if hasattr(source, "__self__"): self.work_sources.append(weakref.WeakMethod(source))
+        else: self.work_sources.append(lambda: source)
+
+    # Whether the next frame has anything to do without new input: Blocks or regions waiting to be rendered, held buttons
+    # that execute repeatedly, tooltips following the mouse, or a registered work source that is busy.
+    def has_pending_work(self):
+        if self.full_repaint or self.dirty_regions or self.render_queue: return True
+        if any(block.execute_repeating or block.is_tooltip for block in self.active_io_blocks): return True
+        for reference in self.work_sources:
+            source = reference()
+            if source and source(): return True
+        return False
+
+ACTIVE_SCENE = Scene() # The Scene that is rendered and receives input.
+
+def active_scene():
+    return ACTIVE_SCENE
+
+# Makes another Scene the one that is rendered and receives input. The whole window is repainted on the next frame.
+def set_active_scene(scene: Scene):
+    global ACTIVE_SCENE
+    ACTIVE_SCENE = scene
+    scene.full_repaint = True
+    scene.hit_grid.dirty = True
+
+# Makes the compositor call profiler.time_block(block) in place of block.blit_sequence(), or stops it with None.
+def set_profiler(profiler):
+    global PROFILER
+    PROFILER = profiler
+
+def default_font():
+    global DEFAULT_FONT
+    if not DEFAULT_FONT: DEFAULT_FONT = pygame.font.Font("freesansbold.ttf", 12)
+    return DEFAULT_FONT
+
 # Call this before starting the main loop of an application.
 def initiate_blocks(main_window: pygame.Surface, background_default: pygame.Color):
-    for block in BLOCKS:
-        if block.bg_color == TRANSPARENT: block.bg_color = background_default
-        block.render(main_window)
-    UPDATE_APPEARANCE_BLOCKS.sort(key=lambda block: block.z_order)
+    global BACKGROUND_DEFAULT
+    BACKGROUND_DEFAULT = background_default
+    for block in ACTIVE_SCENE:
+        if block.bg_color == TRANSPARENT:
+            # The other states keep the colors derived from the transparent background.
+            block.derive_variants("bg_color")
+            block.bg_color = background_default
+    composite(main_window, [main_window.get_rect()])
+    request_region_render(main_window.get_rect())
 
 # Call this every frame of the application loop. Use the returned value and pass it to the Pygame window's update() function.
 def render_upate_blocks(main_window: pygame.Surface, io_state: IO_State):
-    refresh_rects = []
-    for block in [block for block in UPDATE_APPEARANCE_BLOCKS if block.render_next_frame]:
+    refresh_rects = render_blocks(main_window)
+    dispatch_io(io_state)
+    return refresh_rects
+
+# The rendering half of render_upate_blocks: repaints the Blocks flagged for rendering and the dirty regions, and
+# returns the rects of the window that changed.
+def render_blocks(main_window: pygame.Surface):
+    scene = ACTIVE_SCENE
+    regions = scene.dirty_regions[:]
+    scene.dirty_regions.clear()
+    if scene.full_repaint:
+        regions.append(main_window.get_rect())
+        scene.full_repaint = False
+    while scene.render_queue:
+        block = heapq.heappop(scene.render_queue)[2]
         block.render_next_frame = False
-        refresh_rects.append(block.global_rect)
-        block.render(main_window)
-    for block in UPDATE_IO_BLOCKS: block.update(io_state)
+        if block.scene is not scene: continue
+        # Both where the Block was painted last time and where it will be painted now have to be repainted.
+        if block.rendered_rect: regions.append(block.rendered_rect)
+        if block.global_visibility: regions.append(block.paint_rect)
+    refresh_rects = merge_rects(regions, main_window.get_rect())
+    composite(main_window, refresh_rects)
     return refresh_rects
 
+# Updates only the IO Blocks whose state the input can change: those under the mouse, those that are already hovered or
+# held, and those that always need input. For every other IO Block, Block.update would do nothing.
+def dispatch_io(io_state: IO_State):
+    scene = ACTIVE_SCENE
+    if scene.hit_grid.dirty: scene.hit_grid.rebuild(scene.io_blocks)
+    blocks = scene.active_io_blocks.union(scene.hit_grid.at(io_state.mouse_position), scene.always_io_blocks)
+    for block in sorted(blocks, key=lambda block: block.io_order):
+        # An earlier Block's command may have destroyed this one, or swapped the active Scene.
+        if block.scene is scene: block.update(io_state)
+
 # Call this whenever the window comes back into focus (as the canvas tends to wipe itself when this happens)
-def render_all(main_window: pygame.Surface, background_default: pygame.Color):
-    main_window.fill(background_default)
-    for block in BLOCKS: block.render(main_window)
+def render_all(main_window: pygame.Surface, background_default: pygame.Color = None):
+    composite(main_window, [main_window.get_rect()], background_default)
     pygame.display.update()
 
-# This function is a convenient way to allow an attribute to be applied
-# to a class instance, providing options such as replacability, strong typing, and default values.
-# - obj:            The object the attribute is to be applied to
-# - kwargs:         The dictionary of provided arguments, whose keys may contain the key specified here
-# - key:            The name of the attribute
-# - attribute_type: The type the provided argument has to take (otherwise, the default is applied)
-# - default:        The default value that the attribute takes in the event of an absence or error
-# - can_replace:    Whether or not the provided argument can replace the obj's attribute of the same name, if it exists
-def get_kwarg(obj, kwargs, key, attribute_type, default, can_replace = False):
-    
-    # If the object already has the attribute, the default variable takes its value.
-    if hasattr(obj, key): default = getattr(obj, key)
-
-    # If the object already has the attribute and it shall not be replaced, make no change.
-    if hasattr(obj, key) and not can_replace: return default
-
-    # If the attribute in question is not provided, make no change.
-    if key not in kwargs: return default
-
-    # If the attribute in question is provided as the wrong type, make no change, and alert the user.
-    if not isinstance(kwargs[key], attribute_type):
-        print(f"Set Attribute Error: {key} should be a {attribute_type} but is a {type(kwargs[key])}")
-        return default
-    
-    # All checks passed; apply the new attribute value.
-    return kwargs[key]
+def has_pending_work():
+    return ACTIVE_SCENE.has_pending_work()
+
+# The number of Blocks waiting to be rendered on the next frame.
+def render_queue_depth():
+    return len(ACTIVE_SCENE.render_queue)
+
+def register_work_source(source, scene: Scene = None):
+    (ACTIVE_SCENE if scene is None else scene).register_work_source(source)
+
+# Wakes up an application loop waiting for events. This can be called from any thread.
+def wake():
+    if pygame.display.get_init(): pygame.event.post(pygame.event.Event(WAKE_EVENT))
+
+def request_region_render(rect: pygame.Rect):
+    ACTIVE_SCENE.request_region_render(rect)
+
+# Merges overlapping rects into their unions, until none of the resulting rects overlap. With bounds (the window's rect),
+# the rects are clipped to it first, empty ones are dropped, and too many rects, or rects covering too much of it, are
+# replaced by the bounds as a whole, which is cheaper to repaint than to merge and composite piece by piece.
+# Each pass sweeps the rects from left to right, and only compares a rect with the merged rects still reaching its left
+# edge. A union can grow into rects that were already passed, so passes repeat until one merges nothing.
+def merge_rects(rects: list, bounds: pygame.Rect = None):
+    if bounds: merged = [bounds.clip(rect) for rect in rects]
+    else: merged = [pygame.Rect(rect) for rect in rects]
+    merged = [rect for rect in merged if rect.width and rect.height]
+    if bounds and merged and (len(merged) > MERGE_RECT_LIMIT or
+                              sum(rect.width * rect.height for rect in merged) >= FULL_REPAINT_SHARE * bounds.width * bounds.height):
+        return [pygame.Rect(bounds)]
+
+    changed = True
+    while changed:
+        changed = False
+        merged.sort(key=lambda rect: rect.left)
+        swept = []
+        active = [] # The rects of swept whose right edge is past the current rect's left edge
+        for rect in merged:
+            active = [other for other in active if other.right > rect.left]
+            i = rect.collidelist(active)
+            while i != -1:
+                other = active.pop(i)
+                rect.union_ip(other)
+                other.width = 0 # Left in swept, to be dropped after the pass
+                changed = True
+                i = rect.collidelist(active)
+            active.append(rect)
+            swept.append(rect)
+        merged = [rect for rect in swept if rect.width]
+    return merged
+
+# Repaints each region from the background up: every visible Block that intersects it is rendered again in z-order,
+# clipped to the region, so that overlapping parents, children and siblings all stay correct. The Blocks of a region
+# are found through the Scene's paint grid, so a frame costs in proportion to the Blocks in its regions.
+# The regions never overlap (see merge_rects), so all of them are filled first, and then every Block's blits of every
+# region are clipped to their region by hand and submitted to the window together in a single Surface.blits call.
+def composite(main_window: pygame.Surface, regions: list, background_default: pygame.Color = None):
+    background = background_default or BACKGROUND_DEFAULT
+    scene = ACTIVE_SCENE
+    profiler = PROFILER
+    sequences = {} # Block -> its blits for this frame, which are only generated once however many regions it is in
+    batch = []
+    window = main_window.get_rect()
+    for region in regions:
+        # Surface.fill moves a rect that starts left of or above the window instead of clipping it.
+        region = window.clip(region)
+        if not region: continue
+        main_window.fill(background, region)
+        for block in scene.blocks_overlapping(region):
+            sequence = sequences.get(block)
+            if sequence is None: sequence = sequences[block] = block.blit_sequence() if profiler is None else profiler.time_block(block)
+            for surface, position in sequence:
+                rect = region.clip(pygame.Rect(position, surface.get_size()))
+                if rect: batch.append((surface, rect.topleft, rect.move(-position[0], -position[1])))
+    if batch: main_window.blits(batch, doreturn = False)
+
+# One attribute of a Block's schema, which is also the keyword argument that sets it.
+# - name:    The name of the attribute
+# - type:    The type (or tuple of types) that a provided value has to be an instance of
+# - default: The value taken when the attribute is not provided
+# - derive:  A function of the Block returning the value taken instead of default, for defaults depending on other attributes
+# - convert: A function of the Block and the provided value, returning the value actually applied
+# - variant: Whether the attribute is a Variant, which is left unset when it is not provided
+@dataclass(frozen=True)
+class Attribute:
+    name: str
+    type: object
+    default: object = None
+    derive: object = None
+    convert: object = None
+    variant: bool = False
+
+# A keyword argument that sets several attributes at once, such as position for x and y. It takes precedence over
+# the keyword arguments of those attributes.
+# - name:   The name of the keyword argument
+# - type:   The type (or tuple of types) that a provided value has to be an instance of
+# - expand: A function of the provided value, returning a dictionary from attribute names to their values
+@dataclass(frozen=True)
+class Alias:
+    name: str
+    type: object
+    expand: object
+
+# The keyword arguments a class of Block accepts, declared as a list of Attributes and Aliases. The attributes are
+# applied in order, so that derive and convert can use the ones before them. A subclass extends its parent's schema
+# with Schema.extend. Each Schema is compiled into a lookup table the first time it is applied.
+class Schema:
+    def __init__(self, *entries):
+        self.entries = list(entries)
+        self.lookup = None
+        self.attributes = None
+
+    # Returns a new Schema with more entries. An entry with the same name as an existing one replaces it in place.
+    def extend(self, *entries):
+        extended = self.entries[:]
+        positions = {entry.name: i for i, entry in enumerate(extended)}
+        for entry in entries:
+            if entry.name in positions: extended[positions[entry.name]] = entry
+            else: extended.append(entry)
+        return Schema(*extended)
+
+    def compile(self):
+        self.lookup = {entry.name: entry for entry in self.entries}
+        self.attributes = [(entry.name, entry.default, entry.derive, entry.convert, entry.variant)
+                           for entry in self.entries if isinstance(entry, Attribute)]
+
+    # Validates the keyword arguments and applies every attribute to the object, raising a TypeError for an unknown
+    # keyword argument or a value of the wrong type.
+    def apply(self, obj, kwargs: dict):
+        if self.lookup is None: self.compile()
+        values, aliased = {}, {}
+        for key, value in kwargs.items():
+            entry = self.lookup.get(key)
+            if not entry: raise TypeError(f"{type(obj).__name__} got an unexpected keyword argument '{key}'")
+            if not isinstance(value, entry.type): raise TypeError(f"{key} should be a {entry.type} but is a {type(value)}")
+            if type(entry) is Alias: aliased.update(entry.expand(value))
+            else: values[key] = value
+        values.update(aliased)
+
+        for name, default, derive, convert, variant in self.attributes:
+            if name in values:
+                value = values[name]
+                if convert: value = convert(obj, value)
+            elif variant: continue
+            elif derive: value = derive(obj)
+            else: value = default
+            setattr(obj, name, value)
+
+# A visual attribute of the hover, hold or disabled state, such as bg_color_hover. Unless it is set, it is derived
+# from the idle state's attribute the first time it is read, and kept from then on. The value is stored in the
+# Block's slot of the same name prefixed with an underscore.
+# - base:   The name of the idle state's attribute
+# - derive: The function turning the idle state's value into this state's value (by default, it is the same value)
+class Variant:
+    def __init__(self, base: str, derive = None):
+        self.base = base
+        self.derive = derive
+
+    def __set_name__(self, owner, name):
+        self.slot = "_" + name
+
+    def __get__(self, obj, owner = None):
+        if obj is None: return self
+        try:
+            return getattr(obj, self.slot)
+        except AttributeError:
+            value = getattr(obj, self.base)
+            if self.derive: value = self.derive(value)
+            setattr(obj, self.slot, value)
+            return value
+
+    def __set__(self, obj, value):
+        setattr(obj, self.slot, value)
 
 # The Block is a kind of widget has the potential to imitate almost any standard widget.
 
@@ -95,151 +466,107 @@ class Block:
     ENTER_NNFLOAT = 5
     ENTER_NOCSV = 6
 
-    def __init__(self, **kwargs):
-
-        # ========== VARIABLE USER-SET ATTRIBUTES ==========
+    bg_color_hover = Variant("bg_color", lambda color: color_lighten(color, 0.15))
+    bg_color_hold = Variant("bg_color", lambda color: color_multiply(color, 0.8))
+    bg_color_disabled = Variant("bg_color", lambda color: color_add_white(color, DISABLED_DEFAULT_WHITENESS))
+
+    bd_thick_hover = Variant("bd_thick")
+    bd_thick_hold = Variant("bd_thick")
+    bd_thick_disabled = Variant("bd_thick")
+
+    bd_color_hover = Variant("bd_color", lambda color: color_lighten(color, 0.15))
+    bd_color_hold = Variant("bd_color", lambda color: color_multiply(color, 0.8))
+    bd_color_disabled = Variant("bd_color", lambda color: color_add_white(color, DISABLED_DEFAULT_WHITENESS))
+
+    im_surface_hover = Variant("im_surface", lambda surface: image_blend_add(surface, pygame.Color(25, 25, 25)))
+    im_surface_hold = Variant("im_surface", lambda surface: image_blend_sub(surface, pygame.Color(25, 25, 25)))
+    im_surface_disabled = Variant("im_surface", lambda surface: image_blend_add(surface, pygame.Color(DISABLED_DEFAULT_WHITENESS, DISABLED_DEFAULT_WHITENESS, DISABLED_DEFAULT_WHITENESS)))
+
+    fg_font_hover = Variant("fg_font")
+    fg_font_hold = Variant("fg_font")
+    fg_font_disabled = Variant("fg_font")
+
+    fg_color_hover = Variant("fg_color")
+    fg_color_hold = Variant("fg_color", lambda color: color_multiply(color, 0.8))
+    fg_color_disabled = Variant("fg_color", lambda color: color_add_white(color, DISABLED_DEFAULT_WHITENESS))
+
+    fg_text_hover = Variant("fg_text")
+    fg_text_hold = Variant("fg_text")
+    fg_text_disabled = Variant("fg_text")
+
+    __slots__ = (
+        # User-set attributes.
+        "render_next_frame", "bg_color", "bd_thick", "bd_color", "im_surface", "im_fitted", "im_anchor",
+        "fg_text_limit", "fg_font", "fg_color", "fg_text", "fg_anchor", "fg_offset", "fg_fit_width", "disabled",
+        "local_visibility", "anchor", "x", "y", "w", "h", "parent_x", "parent_y", "z_order", "is_tooltip", "tt_block",
+        "tt_anchor", "tt_offset", "is_button", "execute_on_rising", "execute_repeating", "button_type", "enter_type",
+        "enter_allow_empty", "commands", "args", "update_io", "update_appearance",
+        # The values of the state variants above, once set or derived.
+        "_bg_color_hover", "_bg_color_hold", "_bg_color_disabled", "_bd_thick_hover", "_bd_thick_hold",
+        "_bd_thick_disabled", "_bd_color_hover", "_bd_color_hold", "_bd_color_disabled", "_im_surface_hover",
+        "_im_surface_hold", "_im_surface_disabled", "_fg_font_hover", "_fg_font_hold", "_fg_font_disabled",
+        "_fg_color_hover", "_fg_color_hold", "_fg_color_disabled", "_fg_text_hover", "_fg_text_hold", "_fg_text_disabled",
+        # Read-only attributes.
+        "children", "last_io_state", "mouse_state", "button_held", "fg_surface", "bg_surfaces", "rendered_rect",
+        "transform_dirty", "visibility_dirty", "cached_global_position", "cached_global_rect",
+        "cached_global_visibility", "stored_enter_text", "scene_ref", "creation_index", "io_order", "__weakref__")
+
+    # - scene: The Scene the Block belongs to. By default, it is the Scene of its parent, or else the active Scene.
+    def __init__(self, scene: Scene = None, **kwargs):
 
         # The render flag. It must be set to True manually, VIA THE REQUEST_RENDER FUNCTION, for every frame you wish for it
         # to be visually updated, except for cases involving changes to self.mouse_state and self.button_held.
+        # It is True exactly while the Block is in its Scene's render queue.
         self.render_next_frame = False
 
-        # Background attributes.
-        self.bg_color = get_kwarg(self, kwargs, "bg_color", pygame.Color, TRANSPARENT)
-        self.bg_color_hover = get_kwarg(self, kwargs, "bg_color_hover", pygame.Color, color_lighten(self.bg_color, 0.15))
-        self.bg_color_hold = get_kwarg(self, kwargs, "bg_color_hold", pygame.Color, color_multiply(self.bg_color, 0.8))
-        self.bg_color_disabled = get_kwarg(self, kwargs, "bg_color_disabled", pygame.Color, color_add_white(self.bg_color, DISABLED_DEFAULT_WHITENESS))
-
-        # Border attributes.
-        self.bd_thick = get_kwarg(self, kwargs, "bd_thick", int, 0)
-        self.bd_color = get_kwarg(self, kwargs, "bd_color", pygame.Color, BLACK)
-
-        self.bd_thick_hover = get_kwarg(self, kwargs, "bd_thick_hover", int, self.bd_thick)
-        self.bd_thick_hold = get_kwarg(self, kwargs, "bd_thick_hold", int, self.bd_thick)
-        self.bd_thick_disabled = get_kwarg(self, kwargs, "bd_thick_disabled", int, self.bd_thick)
-
-        self.bd_color_hover = get_kwarg(self, kwargs, "bd_color_hover", pygame.Color, color_lighten(self.bd_color, 0.15))
-        self.bd_color_hold = get_kwarg(self, kwargs, "bd_color_hold", pygame.Color, color_multiply(self.bd_color, 0.8))
-        self.bd_color_disabled = get_kwarg(self, kwargs, "bd_color_disabled", pygame.Color, color_add_white(self.bd_color, DISABLED_DEFAULT_WHITENESS))
-
-        # Image attributes.
-        self.im_surface = get_kwarg(self, kwargs, "im_surface", pygame.Surface, None)
-        self.im_fitted = get_kwarg(self, kwargs, "im_fitted", bool, False)
-        self.im_anchor = get_kwarg(self, kwargs, "im_anchor", Anchor, Anchor(0, 0, 0, 0))
-        self.im_surface_hover = get_kwarg(self, kwargs, "im_surface_hover", pygame.Surface, image_blend_add(self.im_surface, pygame.Color(25, 25, 25)))
-        self.im_surface_hold = get_kwarg(self, kwargs, "im_surface_hold", pygame.Surface, image_blend_sub(self.im_surface, pygame.Color(25, 25, 25)))
-        self.im_surface_disabled = get_kwarg(self, kwargs, "im_surface_disabled", pygame.Surface, image_blend_add(self.im_surface, pygame.Color(DISABLED_DEFAULT_WHITENESS, DISABLED_DEFAULT_WHITENESS, DISABLED_DEFAULT_WHITENESS)))
-
-        # Foreground attributes.
-        self.fg_text_limit = get_kwarg(self, kwargs, "fg_text_limit", int, 30)
-        self.fg_font = get_kwarg(self, kwargs, "fg_font", pygame.font.Font, pygame.font.Font("freesansbold.ttf", 12))
-        self.fg_color = get_kwarg(self, kwargs, "fg_color", pygame.Color, BLACK)
-        self.fg_text = get_kwarg(self, kwargs, "fg_text", str, "")[:self.fg_text_limit]
-        self.fg_anchor = get_kwarg(self, kwargs, "fg_anchor", Anchor, Anchor(0.5, 0.5, 0.5, 0.5))
-        self.fg_offset = get_kwarg(self, kwargs, "fg_offset", tuple, (0, 0))
-        self.fg_fit_width = get_kwarg(self, kwargs, "fg_fit_width", bool, False)
-
-        self.fg_font_hover = get_kwarg(self, kwargs, "fg_font_hover", pygame.font.Font, self.fg_font)
-        self.fg_font_hold = get_kwarg(self, kwargs, "fg_font_hold", pygame.font.Font, self.fg_font)
-        self.fg_font_disabled = get_kwarg(self, kwargs, "fg_font_disabled", pygame.font.Font, self.fg_font)
-
-        self.fg_color_hover = get_kwarg(self, kwargs, "fg_color_hover", pygame.Color, self.fg_color)
-        self.fg_color_hold = get_kwarg(self, kwargs, "fg_color_hold", pygame.Color, color_multiply(self.fg_color, 0.8))
-        self.fg_color_disabled = get_kwarg(self, kwargs, "fg_color_disabled", pygame.Color, color_add_white(self.fg_color, DISABLED_DEFAULT_WHITENESS))
-
-        self.fg_text_hover = get_kwarg(self, kwargs, "fg_text_hover", str, self.fg_text)
-        self.fg_text_hold = get_kwarg(self, kwargs, "fg_text_hold", str, self.fg_text)
-        self.fg_text_disabled = get_kwarg(self, kwargs, "fg_text_disabled", str, self.fg_text)
-
-        # Activation attributes.
-        self.disabled = get_kwarg(self, kwargs, "disabled", bool, False)
-        self.local_visibility = get_kwarg(self, kwargs, "local_visibility", bool, True)
-
-        # ========== CONSTANT USER-SET ATTRIBUTES ==========
-
-        # Position and size attributes.
-        self.anchor = get_kwarg(self, kwargs, "anchor", Anchor, Anchor(0, 0, 0, 0))
-        if "position" in kwargs:
-            (self.x, self.y) = get_kwarg(self, kwargs, "position", tuple, (0, 0))
-        else:
-            self.x = get_kwarg(self, kwargs, "x", int, 0)
-            self.y = get_kwarg(self, kwargs, "y", int, 0)
-
-        if "size" in kwargs:
-            (self.w, self.h) = get_kwarg(self, kwargs, "size", tuple, (0, 0))
-        elif "im_surface" in kwargs:
-            (self.w, self.h) = self.im_surface.get_size()
-        else:
-            self.w = get_kwarg(self, kwargs, "w", int, 0)
-            self.h = get_kwarg(self, kwargs, "h", int, 0)
+        # Apply the user-set attributes; see Block.SCHEMA.
+        self.SCHEMA.apply(self, kwargs)
         if self.fg_fit_width: self.w = font_surface(self.fg_text, TRANSPARENT, self.fg_font).get_width()
 
-        # The only "inheritance" that is passed down from these parental Blocks
-        # are 1) their position, and 2) their visibility.
-        if "parent" in kwargs:
-            self.parent_x = get_kwarg(self, kwargs, "parent", Block, None)
-            self.parent_y = self.parent_x
-        elif "parents" in kwargs:
-            (self.parent_x, self.parent_y) = get_kwarg(self, kwargs, "parents", tuple, (None, None))
-        else:
-            self.parent_x = get_kwarg(self, kwargs, "parent_x", Block, None)
-            self.parent_y = get_kwarg(self, kwargs, "parent_y", Block, None)
-
-        self.z_order = get_kwarg(self, kwargs, "z_order", int, 0)
-
-        # Tooltip attributes. The Block on which a tooltip is based on should be assigned to tt_block, NOT parent.
-        self.is_tooltip = get_kwarg(self, kwargs, "is_tooltip", bool, False)
-        self.tt_block = get_kwarg(self, kwargs, "tt_block", Block, None)
-        self.tt_anchor = get_kwarg(self, kwargs, "tt_anchor", Anchor, Anchor(0, 0, 0, 0))
-        self.tt_offset = get_kwarg(self, kwargs, "tt_offset", tuple, (0, 0))
-
-        # Button attributes.
-        self.is_button = get_kwarg(self, kwargs, "is_button", bool, False)
-        self.execute_on_rising = get_kwarg(self, kwargs, "execute_on_rising", bool, False)
-        self.execute_repeating = get_kwarg(self, kwargs, "execute_repeating", bool, False)
-        self.button_type = get_kwarg(self, kwargs, "button_type", int, Block.BUTTON_STANDARD)
-        self.enter_type = get_kwarg(self, kwargs, "enter_type", int, Block.ENTER_ANY)
-        self.enter_allow_empty = get_kwarg(self, kwargs, "enter_allow_empty", bool, False)
-
-        if "command" not in kwargs:
-            self.commands = get_kwarg(self, kwargs, "commands", list, [])
-            self.args = get_kwarg(self, kwargs, "args", list, [() for _ in range(len(self.commands))])
-        else:
-            self.commands = [get_kwarg(self, kwargs, "command", object, lambda: None)]
-            self.args = [get_kwarg(self, kwargs, "args", tuple, ())]
-
-        # Update attributes.
-        self.update_io = get_kwarg(self, kwargs, "update_io", bool, self.is_button)
-        self.update_appearance = get_kwarg(self, kwargs, "update_appearance", bool, self.is_button)
-
         # =============== READ-ONLY VARIABLES ==============
             
-        self.children = []
-        self.last_io_state = IO_State()
+        self.children = [] # Blocks that use this Block as their parent_x or parent_y.
+        self.last_io_state = NO_IO_STATE
         self.mouse_state = STATE_IDLE
         self.button_held = False
         self.fg_surface = None
+        self.bg_surfaces = {} # Visual state -> (the parameters it was drawn with, the composed background Surface)
+        self.rendered_rect = None # The screen area the Block covered when it was last rendered, including its text.
+
+        # The cached global transform and visibility. They are recomputed lazily after move_to, set_size or
+        # set_visibility marks them dirty, on this Block and on every Block below it.
+        self.transform_dirty = True
+        self.visibility_dirty = True
+        self.cached_global_position = (0, 0)
+        self.cached_global_rect = pygame.Rect(0, 0, 0, 0)
+        self.cached_global_visibility = True
 
         # =============== READ-ONLY CONSTANTS ==============
 
-        self.global_position = self.generate_global_position
-        self.global_visibility = self.generate_global_visibility
         self.stored_enter_text = self.fg_text
         
         # ================= INITIALIZATION =================
         
-        BLOCKS.append(self)
-        if self.update_io: UPDATE_IO_BLOCKS.append(self)
-        if self.update_appearance: UPDATE_APPEARANCE_BLOCKS.append(self)
+        for parent in {self.parent_x, self.parent_y}:
+            if parent: parent.children.append(self)
+        if scene is None and self.parent_x: scene = self.parent_x.scene
+        if scene is None and self.parent_y: scene = self.parent_y.scene
+        (ACTIVE_SCENE if scene is None else scene).add(self)
 
     # ============== DERIVED READ-ONLY VALUES ==============
 
+    # The Scene the Block belongs to, or None once it has been destroyed.
+    @property
+    def scene(self):
+        return self.scene_ref() if self.scene_ref else None
+
     @property
     def global_x(self):
-        return self.x if not self.parent_x else delocalize_position_x(self.parent_x.w, self.w, self.anchor, 0, self.x) + self.parent_x.global_x
+        return self.global_position[0]
     
     @property
     def global_y(self):
-        return self.y if not self.parent_y else delocalize_position_y(self.parent_y.h, self.h, self.anchor, 0, self.y) + self.parent_y.global_y
+        return self.global_position[1]
 
     @property
     def local_position(self):
@@ -248,11 +575,25 @@ class Block:
     @property
     def size(self):
         return (self.w, self.h)
-    
+
+    @property
+    def global_position(self):
+        if self.transform_dirty: self.update_transform()
+        return self.cached_global_position
+
+    # The returned Rect is shared, and must not be modified.
     @property
     def global_rect(self):
-        return pygame.Rect(*self.global_position, *self.size)
-    
+        if self.transform_dirty: self.update_transform()
+        return self.cached_global_rect
+
+    @property
+    def global_visibility(self):
+        if self.visibility_dirty:
+            self.cached_global_visibility = self.generate_global_visibility
+            self.visibility_dirty = False
+        return self.cached_global_visibility
+
     @property
     def generate_global_position(self):
         return (self.x if not self.parent_x else delocalize_position_x(self.parent_x.w, self.w, self.anchor, 0, self.x) + self.parent_x.global_x,
@@ -265,16 +606,70 @@ class Block:
         if self.parent_y and not self.parent_y.global_visibility: return False
         return True
 
+    def update_transform(self):
+        self.cached_global_position = self.generate_global_position
+        self.cached_global_rect = pygame.Rect(*self.cached_global_position, *self.size)
+        self.transform_dirty = False
+
+    # Marks the global transform of this Block and of every Block below it as dirty. A dirty Block's children
+    # are always dirty too (computing a child computes its parents), so an already dirty subtree is skipped.
+    def invalidate_transform(self):
+        if getattr(self, "transform_dirty", True): return
+        self.transform_dirty = True
+        scene = self.scene
+        if scene is not None:
+            scene.moved.add(self)
+            if self.update_io: scene.hit_grid.dirty = True
+        for child in self.children: child.invalidate_transform()
+
+    def invalidate_visibility(self):
+        if getattr(self, "visibility_dirty", True): return
+        self.visibility_dirty = True
+        for child in self.children: child.invalidate_visibility()
+
     # ========== MODIFICATION HELPER FUNCTIONS ==========
 
+    # Moving or resizing a Block repaints the subtree both where it was painted last (its rendered rects) and where it
+    # will be painted now.
     def move_to(self, new_pos: tuple):
+        if (self.x, self.y) == tuple(new_pos): return
         self.x = new_pos[0]
         self.y = new_pos[1]
-        self.global_position = self.generate_global_position
+        self.invalidate_transform()
+        self.request_subtree_render()
 
     def set_size(self, size: tuple):
+        if (self.w, self.h) == tuple(size): return
         self.w = size[0]
         self.h = size[1]
+        self.invalidate_transform()
+        self.request_subtree_render()
+
+    def set_visibility(self, visible: bool = True):
+        if self.local_visibility == visible: return
+        self.local_visibility = visible
+        self.invalidate_visibility()
+        self.request_subtree_render()
+
+    # Schedules the area of this Block and of every Block below it to be repainted.
+    def request_subtree_render(self):
+        scene = self.scene
+        if scene is not None:
+            scene.request_region_render(self.rendered_rect)
+            if self.global_visibility: scene.request_region_render(self.paint_rect)
+        for child in self.children: child.request_subtree_render()
+
+    # Removes this Block and every Block below it from their Scene and detaches it from its parents, so that the whole
+    # subtree can be freed. This takes time proportional to the size of the subtree.
+    def destroy(self):
+        for parent in {self.parent_x, self.parent_y}:
+            if parent and self in parent.children: parent.children.remove(self)
+        self.remove_subtree()
+
+    def remove_subtree(self):
+        scene = self.scene
+        if scene is not None: scene.remove(self)
+        for child in self.children: child.remove_subtree()
 
     def add_command(self, command, args: tuple = (), execution_position: int = -1):
         if execution_position < 0:
@@ -293,24 +688,23 @@ class Block:
         if including_stored: self.stored_enter_text = text
         self.request_render()
 
-    def regenerate_fg_surface(self):
-        fg_color = self.fg_color
-        fg_font = self.fg_font
-        fg_text = ""
+    # Derives the hover, hold and disabled variants of an attribute that have not been set from its current value, so
+    # that they keep that value when the attribute changes afterwards (see Variant).
+    # - base: The name of the idle state's attribute, such as "bg_color"
+    def derive_variants(self, base: str):
+        for state in ("hover", "hold", "disabled"): getattr(self, f"{base}_{state}")
 
-        if not self.is_button \
-            or (self.is_button and not self.disabled and not self.button_type == Block.BUTTON_TOGGLE and self.mouse_state == STATE_IDLE) \
-            or (self.is_button and not self.disabled and self.button_type == Block.BUTTON_TOGGLE and self.mouse_state == STATE_IDLE and not self.button_held):
-            fg_color, fg_font, fg_text = self.fg_color, self.fg_font, self.fg_text
-        elif self.disabled:
-            fg_color, fg_font, fg_text = self.fg_color_disabled, self.fg_font_disabled, self.fg_text_disabled
-        elif self.mouse_state == STATE_HOLD or self.button_held:
-            fg_color, fg_font, fg_text = self.fg_color_hold, self.fg_font_hold, self.fg_text_hold
-        elif self.mouse_state == STATE_HOVER:
-            fg_color, fg_font, fg_text = self.fg_color_hover, self.fg_font_hover, self.fg_text_hover
+    # The text Surface for the current state comes from the shared TEXT_CACHE, so switching between
+    # states (hover, hold, disabled) or re-rendering unchanged text never rasterizes the glyphs again.
+    def regenerate_fg_surface(self):
+        state = self.visual_state
+        if state == STATE_DISABLED: fg_color, fg_font, fg_text = self.fg_color_disabled, self.fg_font_disabled, self.fg_text_disabled
+        elif state == STATE_HOLD: fg_color, fg_font, fg_text = self.fg_color_hold, self.fg_font_hold, self.fg_text_hold
+        elif state == STATE_HOVER: fg_color, fg_font, fg_text = self.fg_color_hover, self.fg_font_hover, self.fg_text_hover
+        else: fg_color, fg_font, fg_text = self.fg_color, self.fg_font, self.fg_text
 
         self.fg_surface = font_surface(fg_text, fg_color, fg_font)
-        if self.fg_fit_width: self.w = self.fg_surface.get_width()
+        if self.fg_fit_width: self.set_size((self.fg_surface.get_width(), self.h))
 
     def disable(self):
         self.disabled = True
@@ -419,55 +813,70 @@ class Block:
         # If the Block is a tooltip, update its position based on the mouse's
         # current position.
         if self.is_tooltip:
-            (self.x, self.y) = delocalize_position(0, 0, *self.size, self.tt_anchor, *io_state.mouse_position, *self.local_position)
+            self.move_to(delocalize_position(0, 0, *self.size, self.tt_anchor, *io_state.mouse_position, *self.local_position))
     
     def change_mouse_state(self, new_state):
         if self.mouse_state == new_state: return
         self.mouse_state = new_state
+        self.update_active()
         self.request_render()
 
     def change_button_held(self, button_held):
         if self.button_held == button_held: return
         self.button_held = button_held
+        self.update_active()
         self.request_render()
 
+    def update_active(self):
+        scene = self.scene
+        if scene is None: return
+        if self.mouse_state != STATE_IDLE or self.button_held: scene.active_io_blocks.add(self)
+        else: scene.active_io_blocks.discard(self)
+
     # ================ RENDER FUNCTION ===============
         
     def request_render(self, ignore_flag: bool = False):
         if not ignore_flag and not self.update_appearance:
             print("WARNING: Trying to render a Block that is not flagged as requiring it")
+        scene = self.scene
+        if self.render_next_frame or scene is None: return
         self.render_next_frame = True
+        heapq.heappush(scene.render_queue, (self.z_order, self.creation_index, self))
 
-    def render(self, main_window: pygame.Surface):
-        if not self.global_visibility: return
-
-        surface = pygame.Surface(self.size, SRCALPHA).convert_alpha()
-
-        # Temporary visual parameters, to be used in rendering.
-        im_surface = None
-        bd_thick = 0
-        bd_color = BLACK
-        bg_color = WHITE
-
-        # Check whether the Block is flagged as a button, and set visual parameters appropriately.
+    # The state whose variant of the visual attributes (colors, border, image, font and text) the Block is drawn with.
+    @property
+    def visual_state(self):
         if not self.is_button \
             or (self.is_button and not self.disabled and not self.button_type == Block.BUTTON_TOGGLE and self.mouse_state == STATE_IDLE) \
             or (self.is_button and not self.disabled and self.button_type == Block.BUTTON_TOGGLE and self.mouse_state == STATE_IDLE and not self.button_held):
-            im_surface = self.im_surface
-            bd_thick, bd_color = self.bd_thick, self.bd_color
-            bg_color = self.bg_color
+            return STATE_IDLE
         elif self.disabled:
-            im_surface = self.im_surface_disabled
-            bd_thick, bd_color = self.bd_thick_disabled, self.bd_color_disabled
-            bg_color = self.bg_color_disabled
+            return STATE_DISABLED
         elif self.mouse_state == STATE_HOLD or self.button_held:
-            im_surface = self.im_surface_hold
-            bd_thick, bd_color = self.bd_thick_hold, self.bd_color_hold
-            bg_color = self.bg_color_hold
+            return STATE_HOLD
         elif self.mouse_state == STATE_HOVER:
-            im_surface = self.im_surface_hover
-            bd_thick, bd_color = self.bd_thick_hover, self.bd_color_hover
-            bg_color = self.bg_color_hover
+            return STATE_HOVER
+        return STATE_IDLE
+
+    # Returns the border, background and image of the current visual state, composed onto one Surface.
+    # Each state's Surface is kept and reused until one of the parameters it was drawn with changes.
+    def background_surface(self):
+        state = self.visual_state
+        if state == STATE_DISABLED:
+            im_surface, bd_thick, bd_color, bg_color = self.im_surface_disabled, self.bd_thick_disabled, self.bd_color_disabled, self.bg_color_disabled
+        elif state == STATE_HOLD:
+            im_surface, bd_thick, bd_color, bg_color = self.im_surface_hold, self.bd_thick_hold, self.bd_color_hold, self.bg_color_hold
+        elif state == STATE_HOVER:
+            im_surface, bd_thick, bd_color, bg_color = self.im_surface_hover, self.bd_thick_hover, self.bd_color_hover, self.bg_color_hover
+        else:
+            im_surface, bd_thick, bd_color, bg_color = self.im_surface, self.bd_thick, self.bd_color, self.bg_color
+
+        parameters = (self.size, self.bd_thick, bd_thick, tuple(bd_color), tuple(bg_color), im_surface, self.im_fitted,
+                      (self.im_anchor.apx, self.im_anchor.acx, self.im_anchor.apy, self.im_anchor.acy))
+        cached = self.bg_surfaces.get(state)
+        if cached and cached[0] == parameters: return cached[1]
+
+        surface = pygame.Surface(self.size, SRCALPHA).convert_alpha()
 
         # Draw the border.
         if self.bd_thick:
@@ -486,22 +895,163 @@ class Block:
                 im_local_position = delocalize_position(*shrunken_rect.size, *self.im_surface.get_size(), self.im_anchor, 0, 0, bd_thick, bd_thick)
                 surface.blit(im_surface, im_local_position, pygame.Rect(0, 0, *shrunken_rect.size))
 
-        # Place the resulting Block onto the main window.
-        main_window.blit(surface, self.global_position)
+        self.bg_surfaces[state] = (parameters, surface)
+        return surface
+
+    # The screen position of the foreground text, with the text Surface regenerated for the current state.
+    def text_position(self):
+        self.regenerate_fg_surface()
+        return addV(self.global_position, delocalize_position(*self.size, *self.fg_surface.get_size(), self.fg_anchor, 0, 0, *self.fg_offset))
+
+    # The screen area the compositor has to consider the Block in: its rect, and wherever it was painted last.
+    @property
+    def occupied_rect(self):
+        if not self.rendered_rect: return self.global_rect
+        return self.global_rect.union(self.rendered_rect)
+
+    # The screen area the Block covers when rendered, which includes text that overflows its rect.
+    @property
+    def paint_rect(self):
+        if not self.fg_text: return self.global_rect
+        return self.global_rect.union(pygame.Rect(self.text_position(), self.fg_surface.get_size()))
+
+    def render(self, main_window: pygame.Surface):
+        main_window.blits(self.blit_sequence(), doreturn = False)
+
+    # Returns the (Surface, position) pairs that render the Block onto the main window, in order, and records the area
+    # they cover. The compositor batches them with those of the other Blocks instead of blitting them one by one.
+    def blit_sequence(self):
+        previous_rect = self.rendered_rect
+        sequence = self.generate_blit_sequence()
+        # Where the Block was painted decides which regions it is composited in, so the paint grid has to follow it.
+        if self.rendered_rect != previous_rect:
+            scene = self.scene
+            if scene is not None: scene.moved.add(self)
+        return sequence
+
+    def generate_blit_sequence(self):
+        if not self.global_visibility:
+            self.rendered_rect = None
+            return []
+
+        # Place the Block's background onto the main window.
+        sequence = [(self.background_surface(), self.global_position)]
+        self.rendered_rect = self.global_rect
 
         # Draw the foreground text.
         if self.fg_text:
-            self.regenerate_fg_surface()
-            text_local_position = delocalize_position(*self.size, *self.fg_surface.get_size(), self.fg_anchor, 0, 0, *self.fg_offset)
-            main_window.blit(self.fg_surface, addV(self.global_position, text_local_position))
+            text_position = self.text_position()
+            sequence.append((self.fg_surface, text_position))
+            self.rendered_rect = self.rendered_rect.union(pygame.Rect(text_position, self.fg_surface.get_size()))
 
         # Update the visibility of the tooltip.
         if self.tt_block:
-            self.tt_block.visibility = (self.tt_block and self.mouse_state == STATE_HOVER or self.mouse_state == STATE_HOLD)
+            self.tt_block.set_visibility(self.mouse_state == STATE_HOVER or self.mouse_state == STATE_HOLD)
+
+        return sequence
 
     # =============== EXECUTE FUNCTION ===============
 
     def execute(self):
         if self.disabled or not self.local_visibility: return
         print("EXECUTE", self.global_position)
-        for i in range(len(self.commands)): self.commands[i](*self.args[i])
\ No newline at end of file
+        for i in range(len(self.commands)): self.commands[i](*self.args[i])
+
+# The keyword arguments of a Block, in the order they are applied.
+Block.SCHEMA = Schema(
+
+    # ========== VARIABLE USER-SET ATTRIBUTES ==========
+
+    # Background attributes.
+    Attribute("bg_color", pygame.Color, TRANSPARENT),
+    Attribute("bg_color_hover", pygame.Color, variant = True),
+    Attribute("bg_color_hold", pygame.Color, variant = True),
+    Attribute("bg_color_disabled", pygame.Color, variant = True),
+
+    # Border attributes.
+    Attribute("bd_thick", int, 0),
+    Attribute("bd_color", pygame.Color, BLACK),
+
+    Attribute("bd_thick_hover", int, variant = True),
+    Attribute("bd_thick_hold", int, variant = True),
+    Attribute("bd_thick_disabled", int, variant = True),
+
+    Attribute("bd_color_hover", pygame.Color, variant = True),
+    Attribute("bd_color_hold", pygame.Color, variant = True),
+    Attribute("bd_color_disabled", pygame.Color, variant = True),
+
+    # Image attributes.
+    Attribute("im_surface", pygame.Surface, None),
+    Attribute("im_fitted", bool, False),
+    Attribute("im_anchor", Anchor, Anchor(0, 0, 0, 0)),
+    Attribute("im_surface_hover", pygame.Surface, variant = True),
+    Attribute("im_surface_hold", pygame.Surface, variant = True),
+    Attribute("im_surface_disabled", pygame.Surface, variant = True),
+
+    # Foreground attributes.
+    Attribute("fg_text_limit", int, 30),
+    Attribute("fg_font", pygame.font.Font, derive = lambda block: default_font()),
+    Attribute("fg_color", pygame.Color, BLACK),
+    Attribute("fg_text", str, "", convert = lambda block, text: text[:block.fg_text_limit]),
+    Attribute("fg_anchor", Anchor, Anchor(0.5, 0.5, 0.5, 0.5)),
+    Attribute("fg_offset", tuple, (0, 0)),
+    Attribute("fg_fit_width", bool, False),
+
+    Attribute("fg_font_hover", pygame.font.Font, variant = True),
+    Attribute("fg_font_hold", pygame.font.Font, variant = True),
+    Attribute("fg_font_disabled", pygame.font.Font, variant = True),
+
+    Attribute("fg_color_hover", pygame.Color, variant = True),
+    Attribute("fg_color_hold", pygame.Color, variant = True),
+    Attribute("fg_color_disabled", pygame.Color, variant = True),
+
+    Attribute("fg_text_hover", str, variant = True),
+    Attribute("fg_text_hold", str, variant = True),
+    Attribute("fg_text_disabled", str, variant = True),
+
+    # Activation attributes.
+    Attribute("disabled", bool, False),
+    Attribute("local_visibility", bool, True),
+
+    # ========== CONSTANT USER-SET ATTRIBUTES ==========
+
+    # Position and size attributes. Without a size, a Block with an image takes the image's size.
+    Attribute("anchor", Anchor, Anchor(0, 0, 0, 0)),
+    Attribute("x", int, 0),
+    Attribute("y", int, 0),
+    Alias("position", tuple, lambda position: {"x": position[0], "y": position[1]}),
+    Attribute("w", int, derive = lambda block: block.im_surface.get_width() if block.im_surface else 0),
+    Attribute("h", int, derive = lambda block: block.im_surface.get_height() if block.im_surface else 0),
+    Alias("size", tuple, lambda size: {"w": size[0], "h": size[1]}),
+
+    # The only "inheritance" that is passed down from these parental Blocks
+    # are 1) their position, and 2) their visibility.
+    Attribute("parent_x", Block, None),
+    Attribute("parent_y", Block, None),
+    Alias("parent", Block, lambda parent: {"parent_x": parent, "parent_y": parent}),
+    Alias("parents", tuple, lambda parents: {"parent_x": parents[0], "parent_y": parents[1]}),
+
+    Attribute("z_order", int, 0),
+
+    # Tooltip attributes. The Block on which a tooltip is based on should be assigned to tt_block, NOT parent.
+    Attribute("is_tooltip", bool, False),
+    Attribute("tt_block", Block, None),
+    Attribute("tt_anchor", Anchor, Anchor(0, 0, 0, 0)),
+    Attribute("tt_offset", tuple, (0, 0)),
+
+    # Button attributes. A single command can be given as command, with its arguments as a tuple in args.
+    Attribute("is_button", bool, False),
+    Attribute("execute_on_rising", bool, False),
+    Attribute("execute_repeating", bool, False),
+    Attribute("button_type", int, Block.BUTTON_STANDARD),
+    Attribute("enter_type", int, Block.ENTER_ANY),
+    Attribute("enter_allow_empty", bool, False),
+
+    Attribute("commands", list, derive = lambda block: []),
+    Alias("command", object, lambda command: {"commands": [command]}),
+    Attribute("args", (list, tuple), derive = lambda block: [() for _ in block.commands],
+              convert = lambda block, args: [args] if isinstance(args, tuple) else args),
+
+    # Update attributes.
+    Attribute("update_io", bool, derive = lambda block: block.is_button),
+    Attribute("update_appearance", bool, derive = lambda block: block.is_button))
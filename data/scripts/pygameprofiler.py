@@ -0,0 +1,134 @@
+import pygame, time, weakref
+from collections import deque
+
+from data.scripts.pygametools import *
+from data.scripts.pygameblock import *
+
+PROFILER_FRAMES = 240                           # How many of the latest frames the percentiles and means are taken over.
+PROFILER_PHASES = ("events", "render", "update", "display")
+PROFILER_REFRESH = 0.5                          # Seconds between refreshes of the overlay.
+PROFILER_BLOCK_WINDOW = 1.0                     # Seconds over which the time spent on each Block is added up.
+PROFILER_SLOWEST = 3                            # How many of the slowest Blocks are listed.
+PROFILER_Z_ORDER = 1000                         # Above every Block of the application.
+PROFILER_BACKGROUND = pygame.Color(0, 0, 0, 170)
+PROFILER_LINE_HEIGHT = 16
+PROFILER_WIDTH = 440
+PROFILER_LINE_WIDTH = PROFILER_WIDTH - 12
+
+def percentile(ordered: list, fraction: float):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+# Shortens a text until it fits a width in pixels when rendered with a font, marking where it was cut.
+def fit_text(text: str, font: pygame.font.Font, width: int):
+    if font.size(text)[0] <= width: return text
+    while text and font.size(text + "...")[0] > width: text = text[:-1]
+    return text + "..."
+
+# An on-screen overlay of where the time of the application loop goes: rolling frame time percentiles, the mean time of
+# each phase of a frame, how much of the window is repainted, and the Blocks that took the longest to render over the
+# last second. The overlay is built from Blocks in the active Scene, above everything else.
+# The loop reports each frame with begin_frame, then mark after each phase, and end_frame once the window is updated.
+# Time spent waiting for events while idle is not part of any frame. While a profiler exists, the compositor times every
+# Block through time_block; when there is none, nothing is measured at all.
+# - window_size: The size of the window, for the share of it that is repainted
+class FrameProfiler:
+    def __init__(self, window_size: tuple):
+        self.window_area = window_size[0] * window_size[1]
+        self.frame_times = deque(maxlen=PROFILER_FRAMES)
+        self.phase_times = {phase: deque(maxlen=PROFILER_FRAMES) for phase in PROFILER_PHASES}
+        self.dirty_counts = deque(maxlen=PROFILER_FRAMES)
+        self.dirty_areas = deque(maxlen=PROFILER_FRAMES)
+        self.frame_start = 0.0
+        self.last_mark = 0.0
+        self.current_phases = {}
+        self.block_times = weakref.WeakKeyDictionary() # Block -> seconds spent in its blit_sequence since block_window_start, without keeping it alive
+        self.block_window_start = time.perf_counter()
+        self.slowest = []     # (seconds, description) of the slowest Blocks of the last complete window
+        self.last_refresh = 0.0
+
+        self.panel = Block(
+            position = (8, 8),
+            size = (PROFILER_WIDTH, PROFILER_LINE_HEIGHT * (3 + PROFILER_SLOWEST) + 8),
+            bg_color = PROFILER_BACKGROUND,
+            z_order = PROFILER_Z_ORDER)
+        self.lines = [Block(
+            parent = self.panel,
+            position = (6, 4 + PROFILER_LINE_HEIGHT * i),
+            size = (PROFILER_LINE_WIDTH, PROFILER_LINE_HEIGHT),
+            fg_text_limit = 100,
+            fg_font = default_font(),
+            fg_color = WHITE,
+            fg_anchor = Anchor(0, 0, 0.5, 0.5),
+            z_order = PROFILER_Z_ORDER,
+            update_appearance = True) for i in range(3 + PROFILER_SLOWEST)]
+        self.hud_blocks = {self.panel, *self.lines}
+        self.panel.request_subtree_render()
+        set_profiler(self)
+
+    # Removes the overlay and stops timing Blocks.
+    def close(self):
+        set_profiler(None)
+        self.panel.destroy()
+        self.block_times.clear()
+
+    def begin_frame(self):
+        self.frame_start = self.last_mark = time.perf_counter()
+        self.current_phases = {}
+
+    # Ends the current phase of the frame.
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        self.current_phases[phase] = self.current_phases.get(phase, 0.0) + now - self.last_mark
+        self.last_mark = now
+
+    def end_frame(self, refresh_rects: list):
+        self.mark("display")
+        now = self.last_mark
+        self.frame_times.append(now - self.frame_start)
+        for phase, times in self.phase_times.items(): times.append(self.current_phases.get(phase, 0.0))
+        self.dirty_counts.append(len(refresh_rects))
+        self.dirty_areas.append(sum(rect.width * rect.height for rect in refresh_rects))
+
+        if now - self.block_window_start >= PROFILER_BLOCK_WINDOW:
+            # Blocks destroyed since they were timed are left out.
+            timed = [(block, seconds) for block, seconds in self.block_times.items() if block.scene is not None]
+            ranked = sorted(timed, key=lambda entry: entry[1], reverse=True)[:PROFILER_SLOWEST]
+            self.slowest = [(seconds, self.describe(block)) for block, seconds in ranked]
+            self.block_times.clear()
+            self.block_window_start = now
+        if now - self.last_refresh >= PROFILER_REFRESH:
+            self.last_refresh = now
+            for line, text in zip(self.lines, self.report()):
+                text = fit_text(text, line.fg_font, PROFILER_LINE_WIDTH)
+                if line.fg_text != text: line.set_all_fg_text(text)
+
+    # Called by the compositor in place of block.blit_sequence(). Most of a Block's rendering cost is here, as it
+    # redraws the background and text Surfaces that changed; the blits themselves are batched for every Block at once.
+    def time_block(self, block):
+        start = time.perf_counter()
+        sequence = block.blit_sequence()
+        if block not in self.hud_blocks:
+            self.block_times[block] = self.block_times.get(block, 0.0) + time.perf_counter() - start
+        return sequence
+
+    def describe(self, block):
+        text = f" '{block.fg_text[:16]}'" if block.fg_text else ""
+        return f"{type(block).__name__}{text} at {tuple(int(v) for v in block.global_position)}"
+
+    # The lines of the overlay.
+    def report(self):
+        lines = []
+        if self.frame_times:
+            ordered = sorted(self.frame_times)
+            lines.append(f"frame ms  p50 {percentile(ordered, 0.5) * 1e3:.2f}  p95 {percentile(ordered, 0.95) * 1e3:.2f}  "
+                         f"p99 {percentile(ordered, 0.99) * 1e3:.2f}  max {ordered[-1] * 1e3:.2f}  ({len(ordered)} frames)")
+            lines.append("mean ms  " + "  ".join(f"{phase} {sum(times) / len(times) * 1e3:.2f}" for phase, times in self.phase_times.items()))
+            area = sum(self.dirty_areas) / len(self.dirty_areas)
+            lines.append(f"dirty per frame  {sum(self.dirty_counts) / len(self.dirty_counts):.1f} rects  "
+                         f"{area:.0f} px ({area / self.window_area:.1%})")
+        else:
+            lines += ["frame ms  -", "mean ms  -", "dirty per frame  -"]
+        for i in range(PROFILER_SLOWEST):
+            if i < len(self.slowest): lines.append(f"{i + 1}. {self.slowest[i][0] * 1e3:.2f} ms  {self.slowest[i][1]}")
+            else: lines.append("")
+        return lines
@@ -1,6 +1,7 @@
 import pygame, math, time
 from pygame.locals import *
 from pygame import gfxdraw
+from collections import OrderedDict
 
 from data.scripts.res import *
 from data.scripts.linalg import *
@@ -26,8 +27,39 @@ def load_music(path: str):
 
 # Labels
 
+TEXT_CACHE_SIZE = 256
+
+# A bounded, least-recently-used cache of rendered text, shared by every label. Rasterizing glyphs is expensive for
+# large fonts, so a label that is rendered again with the same text, color, font and antialiasing reuses its Surface.
+# The cached Surfaces are shared, so they must only ever be blitted, never drawn onto.
+class TextSurfaceCache:
+    def __init__(self, capacity: int = TEXT_CACHE_SIZE):
+        self.capacity = capacity
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text: str, color: tuple, font: pygame.font.Font, antialias: bool = True):
+        key = (text, tuple(color), font, antialias)
+        surface = self.surfaces.get(key)
+        if surface:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.capacity: self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+
+TEXT_CACHE = TextSurfaceCache()
+
 def font_surface(text: str, color: tuple, font: pygame.font.Font, antialias: bool = True):
-    return font.render(text, True, color)
+    return TEXT_CACHE.get(text, color, font, antialias)
 
 
 # Cursors
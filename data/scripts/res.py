@@ -41,4 +41,7 @@ def new_directory(path):
     os.mkdir(resource_path(path))
 
 def rename_file(src, dst):
-    os.rename(resource_path(src), resource_path(dst))
\ No newline at end of file
+    os.rename(resource_path(src), resource_path(dst))
+
+def data_path(path):
+    return os.path.join(os.path.dirname(sys.argv[0]), "data", path)
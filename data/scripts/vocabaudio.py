@@ -0,0 +1,280 @@
+import requests, hashlib, os, threading, io, time, pygame
+from collections import OrderedDict, deque
+from urllib.parse import urlparse
+
+from data.scripts.res import *
+
+AUDIO_CACHE_PATH = data_path("audio")
+AUDIO_CACHE_BUDGET = 64 * 1024 * 1024 # Bytes of audio kept on disk before the least recently played clips are evicted.
+PREFETCH_COUNT = 5                    # How many upcoming Items have their clips downloaded ahead of time.
+AUDIO_CHANNELS = 2                    # Mixer channels reserved for pronunciation clips.
+DECODED_CLIPS = 32                    # How many clips are kept decoded in memory.
+SPECULATIVE_CLIPS = 200               # How many clips of a level range are downloaded before a quiz on it has even started.
+
+# libvlc is only needed to play clips that the mixer cannot decode.
+try:
+    import vlc
+except ImportError:
+    vlc = None
+
+# A local copy of pronunciation clips, so that each clip is only ever downloaded once.
+# Clips are stored under a hash of their URL (the API's audio URLs never change content), and once the total size
+# exceeds the budget, the least recently used clips are deleted first, skipping the ones that are being read.
+# - directory: Where the clips are stored
+# - budget:    The maximum total size of the clips in bytes
+class AudioCache:
+    def __init__(self, directory: str = AUDIO_CACHE_PATH, budget: int = AUDIO_CACHE_BUDGET):
+        self.directory = directory
+        self.budget = budget
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        self.downloads = {} # Key -> Event, for downloads in progress
+        self.readers = {}   # Key -> the number of threads reading the clip, which is not evicted until they are done
+
+        # Rebuild the LRU order from the last access times on disk, least recently used first.
+        os.makedirs(directory, exist_ok=True)
+        self.entries = OrderedDict()
+        files = [os.path.join(directory, name) for name in os.listdir(directory) if not name.endswith('.tmp')]
+        for path in sorted(files, key=os.path.getmtime):
+            self.entries[os.path.basename(path)] = os.path.getsize(path)
+        self.size = sum(self.entries.values())
+
+    def key(self, url: str):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest() + os.path.splitext(urlparse(url).path)[1]
+
+    # Returns the local path of a clip if it is cached, marking it as recently used, or None otherwise.
+    def path(self, url: str):
+        key = self.key(url)
+        with self.lock:
+            if key not in self.entries: return None
+            self.entries.move_to_end(key)
+        path = os.path.join(self.directory, key)
+        try:
+            os.utime(path)
+        except OSError:
+            with self.lock: self.forget(key)
+            return None
+        return path
+
+    # Returns the local path of a clip, downloading it first if it is not cached yet.
+    def fetch(self, url: str):
+        key = self.key(url)
+        while True:
+            path = self.path(url)
+            if path: return path
+            with self.lock:
+                download = self.downloads.get(key)
+                if not download:
+                    self.downloads[key] = threading.Event()
+                    break
+            # Another thread is already downloading this clip.
+            download.wait()
+
+        try:
+            response = self.session.get(url, timeout=30)
+            response.raise_for_status()
+            path = os.path.join(self.directory, key)
+            with open(path + '.tmp', 'wb') as f: f.write(response.content)
+            os.replace(path + '.tmp', path)
+            with self.lock:
+                self.entries[key] = len(response.content)
+                self.size += len(response.content)
+                self.evict()
+            return path
+        finally:
+            with self.lock: self.downloads.pop(key).set()
+
+    # Returns the contents of a clip, downloading it first if it is not cached yet.
+    def read(self, url: str):
+        key = self.key(url)
+        with self.lock: self.readers[key] = self.readers.get(key, 0) + 1
+        try:
+            with open(self.fetch(url), 'rb') as f: return f.read()
+        finally:
+            with self.lock:
+                self.readers[key] -= 1
+                if not self.readers[key]: del self.readers[key]
+
+    def forget(self, key: str):
+        self.size -= self.entries.pop(key, 0)
+
+    # Deletes the least recently used clips until the cache fits its budget again. The newest clip is always kept, and
+    # so are the clips being read. Called with the lock held.
+    def evict(self):
+        for key in list(self.entries)[:-1]:
+            if self.size <= self.budget: break
+            if key in self.readers: continue
+            self.forget(key)
+            try:
+                os.remove(os.path.join(self.directory, key))
+            except OSError:
+                pass
+
+AUDIO_CACHE = None # The AudioCache, created by audio_cache the first time it is needed, so that importing this module never touches the disk.
+AUDIO_CACHE_LOCK = threading.Lock()
+
+def audio_cache():
+    global AUDIO_CACHE
+    with AUDIO_CACHE_LOCK:
+        if AUDIO_CACHE is None: AUDIO_CACHE = AudioCache()
+        return AUDIO_CACHE
+
+# Plays pronunciation clips through pygame's mixer. Each clip is decoded once into an in-memory Sound, and played on a
+# fixed pool of reserved mixer channels, so replaying a clip costs no parsing, decoding or player setup at all.
+# - cache:    The AudioCache clips are read from, by default the one of audio_cache
+# - channels: The number of mixer channels reserved for clips
+# - capacity: How many decoded clips are kept in memory, least recently used ones being dropped first
+class AudioEngine:
+    def __init__(self, cache: AudioCache = None, channels: int = AUDIO_CHANNELS, capacity: int = DECODED_CLIPS):
+        self.own_cache = cache
+        self.channel_count = channels
+        self.capacity = capacity
+        self.sounds = OrderedDict() # URL -> Sound
+        self.lock = threading.Lock()
+        self.channels = None
+        self.next_channel = 0
+        self.last_url = None
+        self.latencies = deque(maxlen=100) # Seconds from each call to play until the clip was started
+
+    @property
+    def cache(self):
+        return self.own_cache or audio_cache()
+
+    # Reserves the channel pool, so that sound effects played with Sound.play never take a clip's channel.
+    def reserve_channels(self):
+        if self.channels: return
+        if not pygame.mixer.get_init(): pygame.mixer.init()
+        pygame.mixer.set_reserved(self.channel_count)
+        self.channels = [pygame.mixer.Channel(i) for i in range(self.channel_count)]
+
+    def decoded(self, url: str):
+        with self.lock:
+            sound = self.sounds.get(url)
+            if sound: self.sounds.move_to_end(url)
+            return sound
+
+    # Returns the decoded Sound of a clip, downloading and decoding it first if needed,
+    # or None if the mixer cannot decode it.
+    def load(self, url: str):
+        sound = self.decoded(url)
+        if sound: return sound
+        data = self.cache.read(url)
+        try:
+            sound = pygame.mixer.Sound(file=io.BytesIO(data))
+        except pygame.error as error:
+            print(f"Could not decode {url}: {error}")
+            return None
+        with self.lock:
+            self.sounds[url] = sound
+            while len(self.sounds) > self.capacity: self.sounds.popitem(last=False)
+        return sound
+
+    # Plays a clip, returning whether it could be played through the mixer. It is called from the application loop,
+    # so it never downloads: a clip that is not cached yet is left to the prefetcher (see Clip.play).
+    def play(self, url: str):
+        start = time.perf_counter()
+        self.reserve_channels()
+        sound = self.decoded(url)
+        if not sound:
+            if not self.cache.path(url): return False
+            try:
+                sound = self.load(url)
+            except (requests.RequestException, OSError, pygame.error) as error:
+                print(f"Could not play {url}: {error}")
+                return False
+            if not sound: return False
+
+        self.stop()
+        channel = self.channels[self.next_channel]
+        self.next_channel = (self.next_channel + 1) % len(self.channels)
+        channel.play(sound)
+        self.last_url = url
+        self.latencies.append(time.perf_counter() - start)
+        return True
+
+    def stop(self):
+        if not self.channels: return
+        for channel in self.channels: channel.stop()
+
+    def replay(self):
+        if self.last_url: self.play(self.last_url)
+
+    # The median and worst start latency of the recent plays, in seconds.
+    def latency(self):
+        if not self.latencies: return (0.0, 0.0)
+        ordered = sorted(self.latencies)
+        return (ordered[len(ordered) // 2], ordered[-1])
+
+# The playable handle returned by Item.sound().
+class Clip:
+    __slots__ = ('url',)
+
+    def __init__(self, url: str):
+        self.url = url
+
+    # Plays the clip if it is cached, or else has it loaded next, and streams it through libvlc in the meantime if available.
+    def play(self):
+        if not self.url: return
+        if AUDIO_ENGINE.play(self.url): return
+        AUDIO_PREFETCHER.prioritize(self.url)
+        if vlc: vlc.MediaPlayer(audio_cache().path(self.url) or self.url).play()
+
+    def stop(self):
+        AUDIO_ENGINE.stop()
+
+# Loads clips on a background thread ahead of when they are played.
+# Every call to prefetch replaces the pending clips, so the queue always follows the current position in a deck.
+# The thread is only started once there is a first clip to load.
+# - load:   The function each clip's URL is passed to, such as AudioCache.fetch or AudioEngine.load
+# - notify: An optional function called on the prefetching thread after each clip is loaded, such as pygameblock.wake
+class AudioPrefetcher:
+    def __init__(self, load, notify = None):
+        self.load = load
+        self.notify = notify
+        self.pending = []
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def prefetch(self, urls: list):
+        with self.condition:
+            self.pending = [url for url in urls if url]
+            self.wake()
+
+    # Same as prefetch, but keeps the clips that are already pending.
+    def extend(self, urls: list):
+        with self.condition:
+            self.pending += [url for url in urls if url]
+            self.wake()
+
+    # Moves a clip to the front of the pending clips, keeping the others behind it.
+    def prioritize(self, url: str):
+        if not url: return
+        with self.condition:
+            self.pending = [url] + [pending for pending in self.pending if pending != url]
+            self.wake()
+
+    # Called with the condition held after the pending clips changed.
+    def wake(self):
+        if self.pending and not self.thread:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        self.condition.notify()
+
+    def cancel(self):
+        self.prefetch([])
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending: self.condition.wait()
+                url = self.pending.pop(0)
+            try:
+                self.load(url)
+            except (requests.RequestException, OSError, pygame.error) as error:
+                print(f"Could not prefetch {url}: {error}")
+                continue
+            if self.notify: self.notify()
+
+AUDIO_ENGINE = AudioEngine()
+AUDIO_PREFETCHER = AudioPrefetcher(AUDIO_ENGINE.load)
+SPECULATIVE_PREFETCHER = AudioPrefetcher(lambda url: audio_cache().fetch(url)) # Downloads only, so that it never evicts decoded clips in use
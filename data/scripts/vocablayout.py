@@ -6,6 +6,7 @@ from .pygametools import *
 from .pygameblock import *
 from .vocabstyle import *
 from .vocabwk import *
+from .vocabaudio import *
 from .vocabstate import *
 
 sfx_start = load_sfx('start.wav', 0.5)
@@ -15,22 +16,36 @@ sfx_incorrect = load_sfx('incorrect.wav')
 
 modes = ['Listening', 'Writing', 'Speaking']
 
+PROGRESSIVE_START = True # Start quizzing as soon as the first page of vocabulary arrives, instead of after all of them.
+
 class Layout(Block):
 
+    SCHEMA = Block.SCHEMA.extend(
+        Attribute("w", int, WINDOW_SIZE[0]),
+        Attribute("h", int, WINDOW_SIZE[1]),
+        Attribute("bd_color", pygame.Color, derive = lambda layout: COLOR_FG_SECONDARY),
+        Attribute("bd_thick", int, BORDER_MAIN),
+        Attribute("update_io", bool, True))
+
     def __init__(self, **kwargs):
 
         self.tutorial = True
         self.mode = 0
         self.state = VocabState(STATE_IDLE, [], 0, [], 0)
         self.previous_state = None
-
-        (self.w, self.h) = WINDOW_SIZE
-        self.bd_color = COLOR_FG_SECONDARY
-        self.bd_thick = BORDER_MAIN
-        self.update_io = True
+        self.progressive_start = PROGRESSIVE_START
+        self.loader = None
+        self.load_error = None  # The error that ended the loading of the current quiz's deck early, if any
+        self.speculation = None # A PageLoader for the selected range, started before the quiz is
+        self.speculative_clips = 0
 
         Block.__init__(self, **kwargs)
 
+        # Keep the application loop running at full speed while vocabulary is arriving, and wake it up when pages or clips
+        # arrive while it is waiting for events.
+        self.scene.register_work_source(self.is_loading)
+        AUDIO_PREFETCHER.notify = wake
+
         self.title_label = Block(
             parent = self,
             size = (750, 75),
@@ -135,6 +150,10 @@ class Layout(Block):
         self.previous_state = self.state
         self.state = VocabState(*args)
 
+    # Replaces the state without making it the one that undo goes back to, for states the user never acted on (loading).
+    def replace_state(self, *args):
+        self.state = VocabState(*args)
+
     def reverse_state(self):
         if not self.previous_state: return
         self.state = self.previous_state
@@ -145,14 +164,44 @@ class Layout(Block):
         self.mode = (self.mode + 1) % len(modes)
         self.title_label.set_all_fg_text(f"Japanese {modes[self.mode]} Practice!")
         # change_color_scheme(mode_colors[self.mode])
+        self.speculate()
 
     def set_lower_level(self):
         self.level_lower_enterbox.set_all_fg_text(str(clamp(int(self.level_lower_enterbox.stored_enter_text), 1, 60)))
         self.level_upper_enterbox.set_all_fg_text(str(max(int(self.level_lower_enterbox.stored_enter_text), int(self.level_upper_enterbox.stored_enter_text))))
+        self.speculate()
 
     def set_upper_level(self):
         self.level_upper_enterbox.set_all_fg_text(str(clamp(int(self.level_upper_enterbox.stored_enter_text), 1, 60)))
         self.level_lower_enterbox.set_all_fg_text(str(min(int(self.level_lower_enterbox.stored_enter_text), int(self.level_upper_enterbox.stored_enter_text))))
+        self.speculate()
+
+    def is_loading(self):
+        return self.loader is not None
+
+    # The subject type and the levels that a quiz started right now would be on.
+    def selection(self):
+        type = 'kanji' if modes[self.mode] == 'Writing' else 'vocabulary'
+        return type, list(range(int(self.level_lower_enterbox.stored_enter_text), int(self.level_upper_enterbox.stored_enter_text) + 1))
+
+    # Starts loading the selected range in the background (along with its audio, in the modes that play it), so that it is
+    # usually ready by the time the quiz starts. Whatever was being loaded for a previous selection is cancelled.
+    def speculate(self):
+        type, levels = self.selection()
+        if self.speculation and self.speculation.matches(type, levels): return
+        self.cancel_speculation()
+        self.speculative_clips = 0
+        self.speculation = PageLoader(type, levels, self.speculate_audio if modes[self.mode] in ['Listening', 'Speaking'] else None, wake)
+
+    def speculate_audio(self, page: list):
+        urls = [v.audio_url for v in page if v.audio_url][:SPECULATIVE_CLIPS - self.speculative_clips]
+        self.speculative_clips += len(urls)
+        SPECULATIVE_PREFETCHER.extend(urls)
+
+    def cancel_speculation(self):
+        if self.speculation: self.speculation.cancel()
+        self.speculation = None
+        SPECULATIVE_PREFETCHER.cancel()
 
     # STATE-MODIFYING ACTIONS
 
@@ -163,20 +212,73 @@ class Layout(Block):
         self.level_upper_enterbox.disable()
         self.level_lower_enterbox.set_all_fg_text(str(clamp(int(self.level_lower_enterbox.stored_enter_text), 1, 60)))
 
-        # Initialize vocabulary list
-        vocabulary = extract('kanji' if modes[self.mode] == 'Writing' else 'vocabulary', list(range(int(self.level_lower_enterbox.stored_enter_text), int(self.level_upper_enterbox.stored_enter_text) + 1)))
-        if modes[self.mode] in ['Listening', 'Speaking']: vocabulary = [v for v in vocabulary if v.audio_url]
-        shuffle(vocabulary)
+        # Initialize vocabulary list, which is filled in by receive_vocabulary as pages arrive.
+        # A speculative load of the same range is taken over, along with everything it has loaded so far.
+        if self.loader: self.loader.cancel()
+        self.load_error = None
+        type, levels = self.selection()
+        if self.speculation and self.speculation.matches(type, levels):
+            self.loader = self.speculation
+            self.speculation = None
+        else:
+            self.cancel_speculation()
+            self.loader = PageLoader(type, levels, notify = wake)
         sfx_start.play()
 
         # Initialize state
-        self.update_state(STATE_QUESTION, vocabulary, 0, [], 1)
+        self.update_state(STATE_LOADING, [], 0, [], 1)
+        self.kanji_label.set_all_fg_text("")
+        self.meaning_label.set_all_fg_text("")
+        self.count_label.set_all_fg_text("Loading...")
+
+        if not self.progressive_start:
+            self.loader.done.wait()
+        self.receive_vocabulary()
+
+    # Adds the pages that arrived since the last frame to the part of the deck that has not been seen yet, shuffling it again.
+    # Starts the next question if it was waiting for one, and ends the phase once the deck has been fully loaded and played.
+    # A load that fails partway is reported as soon as it does, and the quiz goes on with what was loaded.
+    def receive_vocabulary(self):
+        if not self.loader: return
+        pages = self.loader.receive()
+        error = self.loader.error
+        if self.loader.finished: self.loader = None
+        if error and not self.load_error:
+            self.load_error = error
+            self.help_label.set_all_fg_text("Could not load all of the vocabulary! The rest of the quiz is what was loaded.")
+
+        vocabulary = [v for page in pages for v in page]
+        if modes[self.mode] in ['Listening', 'Speaking']: vocabulary = [v for v in vocabulary if v.audio_url]
+        if vocabulary:
+            unseen_start = self.state.vocabulary_index + (0 if self.state.state == STATE_LOADING else 1)
+            unseen = self.state.vocabulary[unseen_start:] + vocabulary
+            shuffle(unseen)
+            self.state.vocabulary[unseen_start:] = unseen
+
+        if self.state.state == STATE_LOADING:
+            if self.state.vocabulary_index < self.state.vocabulary_count:
+                self.replace_state(STATE_QUESTION, self.state.vocabulary, self.state.vocabulary_index, self.state.mistake_indices, self.state.phase)
+                self.render_vocabulary_question()
+                self.render_count()
+            elif not self.loader:
+                self.finish_phase()
+                if error: self.count_label.set_all_fg_text("Could not load the vocabulary!")
+        elif vocabulary:
+            self.render_count()
 
-        # Start vocabulary procedure
-        self.render_vocabulary_question()
-        self.render_count()
+    # Moves on to the mistakes of the phase that has just ended, or finishes if there were none.
+    # This only happens while loading, so undo still goes back to the answer before it.
+    def finish_phase(self):
+        if self.state.mistake_count == 0:
+            self.replace_state(STATE_IDLE, [], 0, [], 0)
+            self.finish()
+        else:
+            self.replace_state(STATE_QUESTION, self.state.mistake_vocabulary, 0, [], self.state.phase + 1)
+            self.render_vocabulary_question()
+            self.render_count()
 
     def render_vocabulary_question(self):
+        self.prefetch_audio()
         if modes[self.mode] == 'Listening':
             self.meaning_label.set_all_fg_text("?")
             self.playback_vocabulary()
@@ -199,6 +301,12 @@ class Layout(Block):
     def render_count(self):
         self.count_label.set_all_fg_text(f"{self.state.vocabulary_index - self.state.mistake_count} / {self.state.vocabulary_index} / {self.state.vocabulary_count}")
 
+    # Downloads the clips of the next few Items in the background, so that they are cached by the time they are played.
+    def prefetch_audio(self):
+        if not modes[self.mode] in ['Listening', 'Speaking']: return
+        upcoming = self.state.vocabulary[self.state.vocabulary_index:self.state.vocabulary_index + PREFETCH_COUNT]
+        AUDIO_PREFETCHER.prefetch([v.audio_url for v in upcoming])
+
     def playback_vocabulary(self):
         if not self.state.vocabulary or not modes[self.mode] == 'Listening': return
 
@@ -220,7 +328,13 @@ class Layout(Block):
 
         new_mistake_indices = self.state.mistake_indices if success else self.state.mistake_indices + [self.state.vocabulary_index]
         new_mistake_vocabulary = self.state.mistake_vocabulary if success else self.state.mistake_vocabulary + [self.state.vocabulary[self.state.vocabulary_index]]
-        if self.state.vocabulary_index == self.state.vocabulary_count - 1:
+        if self.state.vocabulary_index == self.state.vocabulary_count - 1 and self.loader:
+            # The rest of the deck is still on its way.
+            self.update_state(STATE_LOADING, self.state.vocabulary, self.state.vocabulary_index + 1, new_mistake_indices, self.state.phase)
+            self.kanji_label.set_all_fg_text("")
+            self.meaning_label.set_all_fg_text("Loading...")
+            self.render_count()
+        elif self.state.vocabulary_index == self.state.vocabulary_count - 1:
             if self.state.mistake_count == 0:
                 self.update_state(STATE_IDLE, [], 0, [], 0)
                 self.finish()
@@ -242,16 +356,20 @@ class Layout(Block):
         self.render_count()
 
     def finish(self):
+        if self.loader: self.loader.cancel()
+        self.loader = None
         sfx_finish.play()
+        AUDIO_PREFETCHER.cancel()
         self.level_lower_enterbox.enable()
         self.level_upper_enterbox.enable()
         self.kanji_label.set_all_fg_text("")
         self.meaning_label.set_all_fg_text("")
-        self.count_label.set_all_fg_text("You completed the level!")
+        self.count_label.set_all_fg_text("Finished what could be loaded!" if self.load_error else "You completed the level!")
 
     # OVERRIDE
     def update(self, io_state: IO_State):
         super(Layout, self).update(io_state)
+        self.receive_vocabulary()
 
         for event in io_state.key_events:
             if   event.key == K_SPACE: self.start_level()
@@ -0,0 +1,160 @@
+import mmap, struct, os
+from bisect import bisect_left
+
+# A compact, memory-mapped snapshot of the subject catalog. Nothing is parsed up front except for the small level table;
+# every other lookup reads straight out of the mapped file, so memory stays flat however many levels are in it.
+#
+# Layout (little-endian):
+# - Header:       magic, version, level count, record count
+# - Level table:  one (type, level, first record, record count) entry per level, sorted by type and level
+# - Record table: one (subject id, payload offset, payload length) entry per record, grouped by level
+# - Id table:     one (subject id, record) entry per record, sorted by id
+# - Payloads:     reading count, meaning count, then kanji, audio url, readings and meanings as length-prefixed UTF-8
+#
+# A record's fields are the arguments of vocabwk.Item: (id, kanji, readings, meanings, audio_url).
+
+SNAPSHOT_MAGIC = b'WKSS'
+SNAPSHOT_VERSION = 1
+
+TYPE_CODES = {'radical': 0, 'kanji': 1, 'vocabulary': 2, 'kana_vocabulary': 3}
+
+HEADER = struct.Struct('<4sHxxII')
+LEVEL_ENTRY = struct.Struct('<BBxxII')
+RECORD_ENTRY = struct.Struct('<III')
+ID_ENTRY = struct.Struct('<II')
+COUNTS = struct.Struct('<BB')
+STRING_LENGTH = struct.Struct('<H')
+
+def encode_string(text: str):
+    encoded = (text or '').encode('utf-8')
+    return STRING_LENGTH.pack(len(encoded)) + encoded
+
+def encode_payload(kanji: str, readings: list, meanings: list, audio_url: str):
+    return b''.join([COUNTS.pack(len(readings), len(meanings)), encode_string(kanji), encode_string(audio_url),
+                     *[encode_string(reading) for reading in readings], *[encode_string(meaning) for meaning in meanings]])
+
+# Writes a snapshot file.
+# - path:   Where the snapshot is written
+# - levels: A dictionary from (type, level) to the list of record fields of that level
+def write_snapshot(path: str, levels: dict):
+    write_payloads(path, {key: [(fields[0], encode_payload(*fields[1:])) for fields in records] for key, records in levels.items()})
+
+# Writes a snapshot file that holds the levels of an existing snapshot, with the given levels added or replaced.
+# The payloads of the levels that are kept are copied over as they are, without being decoded.
+# - path:   Where the snapshot is written
+# - base:   The Snapshot whose levels are kept, or None
+# - levels: A dictionary from (type, level) to the list of record fields of that level
+def merge_snapshot(path: str, base, levels: dict):
+    payloads = {key: base.payloads(*key) for key in base.levels if key not in levels} if base else {}
+    payloads.update({key: [(fields[0], encode_payload(*fields[1:])) for fields in records] for key, records in levels.items()})
+    write_payloads(path, payloads)
+
+# Writes a snapshot file from encoded records.
+# - path:   Where the snapshot is written
+# - levels: A dictionary from (type, level) to the list of (subject id, payload) of that level
+def write_payloads(path: str, levels: dict):
+    level_keys = sorted(levels, key=lambda key: (TYPE_CODES[key[0]], key[1]))
+    records = [record for key in level_keys for record in levels[key]]
+
+    payload_start = HEADER.size + LEVEL_ENTRY.size * len(level_keys) + (RECORD_ENTRY.size + ID_ENTRY.size) * len(records)
+    payloads = [payload for _, payload in records]
+
+    level_table, first_record = [], 0
+    for key in level_keys:
+        level_table.append(LEVEL_ENTRY.pack(TYPE_CODES[key[0]], key[1], first_record, len(levels[key])))
+        first_record += len(levels[key])
+
+    record_table, offset = [], payload_start
+    for id, payload in records:
+        record_table.append(RECORD_ENTRY.pack(id, offset, len(payload)))
+        offset += len(payload)
+
+    id_table = [ID_ENTRY.pack(id, record) for id, record in sorted((id, record) for record, (id, _) in enumerate(records))]
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(level_keys), len(records)))
+        for part in (level_table, record_table, id_table, payloads): f.write(b''.join(part))
+
+class Snapshot:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, level_count, self.record_count = HEADER.unpack_from(self.buffer, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            self.buffer.close()
+            raise ValueError(f"{path} is not a version {SNAPSHOT_VERSION} subject snapshot")
+
+        # The level table is the only part read up front; it has at most a few hundred entries.
+        self.levels = {}
+        codes = {code: type for type, code in TYPE_CODES.items()}
+        for i in range(level_count):
+            type_code, level, first_record, count = LEVEL_ENTRY.unpack_from(self.buffer, HEADER.size + LEVEL_ENTRY.size * i)
+            self.levels[(codes[type_code], level)] = (first_record, count)
+
+        self.record_table_start = HEADER.size + LEVEL_ENTRY.size * level_count
+        self.id_table_start = self.record_table_start + RECORD_ENTRY.size * self.record_count
+
+    def __len__(self):
+        return self.record_count
+
+    def close(self):
+        self.buffer.close()
+
+    def has_level(self, type: str, level: int):
+        return (type, level) in self.levels
+
+    # Decodes the fields of the record at the given position in the record table.
+    def record(self, record: int):
+        id, offset, _ = RECORD_ENTRY.unpack_from(self.buffer, self.record_table_start + RECORD_ENTRY.size * record)
+        reading_count, meaning_count = COUNTS.unpack_from(self.buffer, offset)
+        offset += COUNTS.size
+        strings = []
+        for _ in range(2 + reading_count + meaning_count):
+            (length,) = STRING_LENGTH.unpack_from(self.buffer, offset)
+            offset += STRING_LENGTH.size
+            strings.append(str(self.buffer[offset:offset + length], 'utf-8'))
+            offset += length
+        kanji, audio_url = strings[0], strings[1] or None
+        return (id, kanji, strings[2:2 + reading_count], strings[2 + reading_count:], audio_url)
+
+    def level(self, type: str, level: int):
+        first_record, count = self.levels.get((type, level), (0, 0))
+        return [self.record(record) for record in range(first_record, first_record + count)]
+
+    # The (subject id, payload) of every record of a level, with the payloads still encoded.
+    def payloads(self, type: str, level: int):
+        first_record, count = self.levels.get((type, level), (0, 0))
+        entries = [RECORD_ENTRY.unpack_from(self.buffer, self.record_table_start + RECORD_ENTRY.size * record)
+                   for record in range(first_record, first_record + count)]
+        return [(id, self.buffer[offset:offset + length]) for id, offset, length in entries]
+
+    def record_id(self, i: int):
+        return ID_ENTRY.unpack_from(self.buffer, self.id_table_start + ID_ENTRY.size * i)[0]
+
+    # Looks up a record by subject id with a binary search over the id table, returning None if it is absent.
+    def get(self, id: int):
+        ids = IdView(self)
+        i = bisect_left(ids, id)
+        if i == len(ids) or ids[i] != id: return None
+        return self.record(ID_ENTRY.unpack_from(self.buffer, self.id_table_start + ID_ENTRY.size * i)[1])
+
+# A read-only sequence over a Snapshot's sorted id table, so that bisect can search it without copying it.
+class IdView:
+    def __init__(self, snapshot: Snapshot):
+        self.snapshot = snapshot
+
+    def __len__(self):
+        return self.snapshot.record_count
+
+    def __getitem__(self, i: int):
+        return self.snapshot.record_id(i)
+
+def open_snapshot(path: str):
+    if not os.path.isfile(path): return None
+    try:
+        return Snapshot(path)
+    except (ValueError, struct.error, OSError) as error:
+        print(f"Could not open the subject snapshot at {path}: {error}")
+        return None
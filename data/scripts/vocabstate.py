@@ -3,10 +3,11 @@ from dataclasses import dataclass
 STATE_IDLE = 0
 STATE_QUESTION = 1
 STATE_ANSWER = 2
+STATE_LOADING = 3 # Waiting for the next Item to arrive
 
 @dataclass
 class VocabState:
-    state: int # 0 - 2
+    state: int # 0 - 3
     vocabulary: list
     vocabulary_index: int
     mistake_indices: list
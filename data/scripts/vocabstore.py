@@ -0,0 +1,74 @@
+import sqlite3, json, threading, time
+from dataclasses import dataclass
+
+from data.scripts.res import *
+
+STORE_PATH = data_path("subjects.db")
+
+# The bookkeeping needed to sync one subject type incrementally.
+@dataclass
+class SyncState:
+    synced_at: str      # The updated_after value for the next delta sync
+    checked_at: float   # The local time from which the last check with the API counts (see SubjectStore.mark_checked)
+    etag: str
+    last_modified: str
+
+# A local SQLite copy of the API's subjects, so that starting a quiz normally needs no network at all.
+# Subjects are stored as their raw JSON, indexed by type and level. A level is only served from the store
+# once it has been filled completely; after that, delta syncs keep it up to date.
+class SubjectStore:
+    def __init__(self, path: str = STORE_PATH):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS subjects (id INTEGER PRIMARY KEY, type TEXT, level INTEGER, updated_at TEXT, json TEXT);
+                CREATE INDEX IF NOT EXISTS subjects_type_level ON subjects (type, level);
+                CREATE TABLE IF NOT EXISTS filled_levels (type TEXT, level INTEGER, PRIMARY KEY (type, level));
+                CREATE TABLE IF NOT EXISTS syncs (type TEXT PRIMARY KEY, synced_at TEXT, checked_at REAL, etag TEXT, last_modified TEXT);
+            """)
+
+    def put(self, subjects: list):
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO subjects VALUES (?, ?, ?, ?, ?)",
+                [(s['id'], s['object'], s['data']['level'], s['data_updated_at'], json.dumps(s)) for s in subjects])
+
+    # Returns the raw subjects of the given levels, ordered by level and id.
+    def subjects(self, type: str, levels: list):
+        levels = list(levels)
+        if not levels: return []
+        with self.lock:
+            rows = self.connection.execute(f"SELECT json FROM subjects WHERE type = ? AND level IN ({', '.join('?' * len(levels))}) ORDER BY level, id",
+                [type, *levels]).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def fill_level(self, type: str, level: int, subjects: list):
+        self.put(subjects)
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO filled_levels VALUES (?, ?)", (type, level))
+
+    # Returns the levels that have not been filled yet, in the given order.
+    def missing_levels(self, type: str, levels: list):
+        with self.lock:
+            filled = {row[0] for row in self.connection.execute("SELECT level FROM filled_levels WHERE type = ?", (type,))}
+        return [level for level in levels if level not in filled]
+
+    # Returns every (type, level) that has been filled.
+    def filled(self):
+        with self.lock:
+            return [tuple(row) for row in self.connection.execute("SELECT type, level FROM filled_levels ORDER BY type, level")]
+
+    def sync_state(self, type: str):
+        with self.lock:
+            row = self.connection.execute("SELECT synced_at, checked_at, etag, last_modified FROM syncs WHERE type = ?", (type,)).fetchone()
+        return SyncState(*row) if row else None
+
+    def set_sync_state(self, type: str, synced_at: str, etag: str = None, last_modified: str = None):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO syncs VALUES (?, ?, ?, ?, ?)", (type, synced_at, time.time(), etag, last_modified))
+
+    # Records a check with the API, at checked_at or else now. A failed check is recorded further in the past, so that
+    # it is retried sooner than a successful one.
+    def mark_checked(self, type: str, checked_at: float = None):
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE syncs SET checked_at = ? WHERE type = ?", (time.time() if checked_at is None else checked_at, type))
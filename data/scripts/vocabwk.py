@@ -1,47 +1,501 @@
-import requests, vlc
+import requests, threading, time, datetime, os, shutil, sys, queue, sqlite3
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from email.utils import parsedate_to_datetime
 
-# Vocabulary class
+from data.scripts.vocabstore import *
+from data.scripts.vocabsnapshot import *
+from data.scripts.vocabaudio import *
+
+# Columnar storage behind every Item. Each subject is one row of parallel integer arrays, and every string
+# (kanji, readings, meanings, audio urls) is interned once in a shared pool and referred to by its index.
+# Readings and meanings are variable-length, so a row stores offsets into flat arrays of string indices.
+class ItemTable:
+    def __init__(self):
+        self.strings = ['']
+        self.string_indices = {'': 0}
+        self.ids = array('I')
+        self.kanji = array('I')
+        self.audio_urls = array('I')
+        self.reading_starts = array('I', [0])
+        self.readings = array('I')
+        self.meaning_starts = array('I', [0])
+        self.meanings = array('I')
+        self.rows = {} # Subject id -> its latest row
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def intern(self, text: str):
+        index = self.string_indices.get(text)
+        if index is None:
+            index = len(self.strings)
+            self.strings.append(sys.intern(text))
+            self.string_indices[text] = index
+        return index
+
+    def string_list(self, indices: array, start: int, end: int):
+        return [self.strings[i] for i in indices[start:end]]
+
+    def fields(self, row: int):
+        return (self.ids[row], self.strings[self.kanji[row]],
+                self.string_list(self.readings, self.reading_starts[row], self.reading_starts[row + 1]),
+                self.string_list(self.meanings, self.meaning_starts[row], self.meaning_starts[row + 1]),
+                self.strings[self.audio_urls[row]] or None)
+
+    # Adds a subject and returns its row. A subject that is already in the table unchanged reuses its row.
+    def append(self, id: int, kanji: str, readings: list, meanings: list, audio_url: str):
+        with self.lock:
+            row = self.rows.get(id)
+            if row is not None and self.fields(row) == (id, kanji or '', list(readings), list(meanings), audio_url or None): return row
+
+            row = len(self.ids)
+            self.ids.append(id)
+            self.kanji.append(self.intern(kanji or ''))
+            self.audio_urls.append(self.intern(audio_url or ''))
+            self.readings.extend([self.intern(reading) for reading in readings])
+            self.reading_starts.append(len(self.readings))
+            self.meanings.extend([self.intern(meaning) for meaning in meanings])
+            self.meaning_starts.append(len(self.meanings))
+            self.rows[id] = row
+            return row
+
+ITEMS = ItemTable()
+
+# The read-only mapping returned by Item.data, with the keys 'Kanji', 'Readings' and 'Meanings'.
+class ItemData:
+    __slots__ = ('item',)
+
+    KEYS = ('Kanji', 'Readings', 'Meanings')
+
+    def __init__(self, item):
+        self.item = item
+
+    def __getitem__(self, key: str):
+        if key == 'Kanji': return self.item.kanji
+        if key == 'Readings': return self.item.readings
+        if key == 'Meanings': return self.item.meanings
+        raise KeyError(key)
+
+    def __contains__(self, key: str):
+        return key in ItemData.KEYS
+
+    def __iter__(self):
+        return iter(ItemData.KEYS)
+
+    def __len__(self):
+        return len(ItemData.KEYS)
+
+    def keys(self):
+        return ItemData.KEYS
+
+# Vocabulary class. An Item is only a view of one row of ITEMS.
 class Item:
+    __slots__ = ('row',)
+
     def __init__(self, id: int, kanji: str, readings: list, meanings: list, audio_url: str):
-        self.id = id
-        self.data = {
-            'Kanji': kanji,
-            'Readings': readings,
-            'Meanings': meanings
-        }
-        self.audio_url = audio_url
+        self.row = ITEMS.append(id, kanji, readings, meanings, audio_url)
+
+    def __eq__(self, other):
+        return isinstance(other, Item) and self.row == other.row
+
+    def __hash__(self):
+        return hash(self.row)
+
+    @property
+    def id(self):
+        return ITEMS.ids[self.row]
+
+    @property
+    def kanji(self):
+        return ITEMS.strings[ITEMS.kanji[self.row]]
+
+    @property
+    def readings(self):
+        return ITEMS.string_list(ITEMS.readings, ITEMS.reading_starts[self.row], ITEMS.reading_starts[self.row + 1])
+
+    @property
+    def meanings(self):
+        return ITEMS.string_list(ITEMS.meanings, ITEMS.meaning_starts[self.row], ITEMS.meaning_starts[self.row + 1])
+
+    @property
+    def audio_url(self):
+        return ITEMS.strings[ITEMS.audio_urls[self.row]] or None
+
+    @property
+    def data(self):
+        return ItemData(self)
 
     def info(self, components):
         lines = []
-        if 'kanji' in components: lines.append(f"Kanji: {self.data['kanji']}")
-        if 'readings' in components: lines.append(f"Readings: {' / '.join(self.data['readings'])}")
-        if 'meanings' in components: lines.append(f"Meanings: {' / '.join(self.data['meanings'])}")
+        if 'kanji' in components: lines.append(f"Kanji: {self.kanji}")
+        if 'readings' in components: lines.append(f"Readings: {' / '.join(self.readings)}")
+        if 'meanings' in components: lines.append(f"Meanings: {' / '.join(self.meanings)}")
         return '\n'.join(lines)
 
     def sound(self):
-        if not self.audio_url: return vlc.MediaPlayer()
-        return vlc.MediaPlayer(self.audio_url)
+        return Clip(self.audio_url)
 
 TOKEN = ''
 BASE = 'https://api.wanikani.com/v2/'
 HEADERS = {'Authorization': 'Bearer ' + TOKEN}
 
-def json_to_obj(json):
+# A single keep-alive session shared by every request, so that connections to the API are pooled and reused.
+MAX_WORKERS = 8
+REQUEST_TIMEOUT = (5, 30) # Seconds to connect, and to wait for each read, before a request is retried
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS))
+SESSION.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS))
+
+class WaniKaniError(Exception):
+    pass
+
+# Paces requests to the API with a token bucket, so that parallel fetches get the highest throughput that stays under the rate limit.
+# The bucket follows the API's RateLimit-* headers, and requests that are throttled (429) or fail on the server (5xx) are retried with backoff.
+# - session:     The session through which requests are sent
+# - limit:       The number of requests allowed per period, until the API reports its own limit
+# - period:      The length of the rate-limit window in seconds
+# - max_retries: How many times a throttled or failed request is retried before giving up
+# - backoff:     The delay in seconds before the first retry, doubled on every following one
+# - timeout:     The timeout of every request that does not pass its own, so that a stalled connection is retried instead of hanging
+# A single request can override max_retries with retries, e.g. to give up at once on a request that nothing waits for.
+class RequestScheduler:
+    def __init__(self, session: requests.Session, limit: int = 60, period: float = 60.0, max_retries: int = 5, backoff: float = 1.0, timeout = REQUEST_TIMEOUT):
+        self.session = session
+        self.timeout = timeout
+        self.limit = limit
+        self.period = period
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self.tokens = float(limit)
+        self.last_refill = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    # Blocks until a token is available, then takes it.
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(float(self.limit), self.tokens + (now - self.last_refill) * self.limit / self.period)
+                self.last_refill = now
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.blocked_until - now, (1 - self.tokens) * self.period / self.limit)
+            time.sleep(wait)
+
+    # Synchronizes the bucket with the rate-limit headers of a response.
+    def observe(self, response: requests.Response):
+        limit = response.headers.get('RateLimit-Limit')
+        remaining = response.headers.get('RateLimit-Remaining')
+        with self.lock:
+            if limit and limit.isdigit(): self.limit = max(int(limit), 1)
+            if remaining and remaining.isdigit(): self.tokens = min(self.tokens, float(remaining))
+
+    # The delay before retrying a response, preferring what the API asks for over exponential backoff.
+    def retry_delay(self, response: requests.Response, attempt: int):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit(): return float(retry_after)
+        reset = response.headers.get('RateLimit-Reset') if response is not None else None
+        if response is not None and response.status_code == 429 and reset and reset.isdigit():
+            return max(int(reset) - time.time(), 0) + 0.1
+        return self.backoff * 2 ** attempt
+
+    def request(self, method: str, url: str, retries: int = None, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        max_retries = self.max_retries if retries is None else retries
+        response = None
+        for attempt in range(max_retries + 1):
+            self.acquire()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                if attempt == max_retries: raise WaniKaniError(f"Could not reach {url}: {error}")
+                time.sleep(self.backoff * 2 ** attempt)
+                continue
+            self.observe(response)
+            if response.status_code != 429 and response.status_code < 500: return response
+
+            # Throttled or failed on the server; hold back every thread until the retry is due.
+            if attempt == max_retries: break
+            delay = self.retry_delay(response, attempt)
+            with self.lock:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+                if response.status_code == 429: self.tokens = 0.0
+        raise WaniKaniError(f"Request to {url} failed with status {response.status_code} after {max_retries} retries")
+
+    def get(self, url: str, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+SCHEDULER = RequestScheduler(SESSION)
+
+# Sends a paced GET request to the API and returns the response, raising a WaniKaniError on any error response.
+# A 304 Not Modified answer to a conditional request is returned as-is. Options such as retries and timeout are passed
+# on to RequestScheduler.request.
+def api_request(url: str, params: dict = None, headers: dict = None, **options):
+    response = SCHEDULER.get(url, params=params, headers={**HEADERS, **(headers or {})}, **options)
+    if response.status_code != 304 and not response.ok: raise WaniKaniError(f"Request to {url} failed with status {response.status_code}: {response.text[:200]}")
+    return response
+
+def api_body(response: requests.Response):
+    body = response.json()
+    if 'data' not in body: raise WaniKaniError(f"Request to {response.url} returned no data: {body}")
+    return body
+
+# Sends a paced GET request to the API and returns its decoded body.
+def api_get(url: str, params: dict = None, **options):
+    return api_body(api_request(url, params, **options))
+
+# Returns the arguments of an Item for a raw subject.
+def subject_fields(json):
     id = json['id']
     data = json['data']
     kanji = data['characters']
     readings = [reading['reading'] for reading in sorted(data['readings'], key=lambda reading: reading['primary'], reverse=True)]
     meanings = [meaning['meaning'] for meaning in sorted(data['meanings'], key=lambda meaning: meaning['primary'], reverse=True)]
-    audio_url = None if ('pronunciation_audios' not in data or data['pronunciation_audios'] == []) else data['pronunciation_audios'][0]['url']
+    # The mixer decodes Ogg Vorbis everywhere, while MP3 support depends on how SDL_mixer was built.
+    audios = data.get('pronunciation_audios') or []
+    audios = [audio for audio in audios if audio.get('content_type') == 'audio/ogg'] or audios
+    audio_url = None if audios == [] else audios[0]['url']
+
+    return (id, kanji, readings, meanings, audio_url)
+
+def json_to_obj(json):
+    return Item(*subject_fields(json))
+
+# Yields the raw subjects of a query one page at a time, following its pages.next_url cursor until the last page has been read.
+def fetch_pages(params: dict):
+    url = BASE + 'subjects'
+    while url:
+        body = api_get(url, params)
+        yield body['data']
+        url = body['pages']['next_url']
+        params = None # The next_url already carries the full query.
+
+def fetch_level_pages(type, level):
+    return fetch_pages({'types': [type], 'levels': [level]})
+
+# Downloads up to max_workers levels in parallel, yielding (level, subjects) for every level in the given order.
+def fetch_levels_concurrent(type, levels, max_workers: int = MAX_WORKERS):
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = [executor.submit(lambda level: [v for page in fetch_level_pages(type, level) for v in page], level) for level in levels]
+        for level, future in zip(levels, futures):
+            yield level, future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+# Local store
+
+STORE = None # The SubjectStore, opened by subject_store the first time it is needed, so that importing this module never opens or creates the database.
+STORE_LOCK = threading.Lock()
+SYNC_INTERVAL = 60 * 60 # Seconds during which the store is trusted without asking the API for changes.
+SYNC_MARGIN = 5 * 60    # Seconds subtracted from the local clock when it stands in for the server's.
+SYNC_RETRY_INTERVAL = 5 * 60 # Seconds after a failed sync before the next one is attempted.
+SYNC_OPTIONS = {'retries': 0, 'timeout': (3, 10)} # A sync is only a freshness check, so it is never retried and gives up quickly.
+
+def subject_store():
+    global STORE
+    with STORE_LOCK:
+        if STORE is None: STORE = SubjectStore()
+        return STORE
+
+def timestamp(moment: datetime.datetime):
+    return moment.astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+def server_timestamp(response: requests.Response):
+    date = response.headers.get('Date')
+    if date: return timestamp(parsedate_to_datetime(date))
+    return timestamp(datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=SYNC_MARGIN))
+
+# Brings the stored subjects of a type up to date, returning whether anything changed.
+# Only subjects updated since the last sync are requested, and the request is conditional, so an unchanged catalog
+# costs a single 304. The updated_after cursor only moves when something changed, which keeps the ETag valid.
+# Every request is a single attempt with a short timeout. A failure is recorded, so that it is not attempted again for
+# SYNC_RETRY_INTERVAL, and raised.
+def sync(type, force: bool = False):
+    state = subject_store().sync_state(type)
+    if not state: return False
+    if not force and time.time() - state.checked_at < SYNC_INTERVAL: return False
+    try:
+        return sync_changes(type, state)
+    except LOAD_ERRORS:
+        subject_store().mark_checked(type, time.time() - SYNC_INTERVAL + SYNC_RETRY_INTERVAL)
+        raise
+
+def sync_changes(type, state: SyncState):
 
-    return Item(id, kanji, readings, meanings, audio_url)
+    conditional = {}
+    if state.etag: conditional['If-None-Match'] = state.etag
+    if state.last_modified: conditional['If-Modified-Since'] = state.last_modified
+    response = api_request(BASE + 'subjects', {'types': [type], 'updated_after': state.synced_at}, conditional, **SYNC_OPTIONS)
+    if response.status_code == 304:
+        subject_store().mark_checked(type)
+        return False
+
+    synced_at = server_timestamp(response)
+    etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+    body = api_body(response)
+    changed = False
+    while True:
+        if body['data']:
+            subject_store().put(body['data'])
+            changed = True
+        if not body['pages']['next_url']: break
+        body = api_get(body['pages']['next_url'], **SYNC_OPTIONS)
+
+    if changed: subject_store().set_sync_state(type, synced_at)
+    else: subject_store().set_sync_state(type, state.synced_at, etag, last_modified)
+    return changed
+
+# Memory-mapped snapshot
+
+SNAPSHOT_PATH = data_path("subjects.snapshot")
+SNAPSHOT = None
+SNAPSHOT_LOCK = threading.RLock()
+
+# Returns the open snapshot, exporting one from the store first if there is none yet.
+def current_snapshot():
+    global SNAPSHOT
+    with SNAPSHOT_LOCK:
+        if not SNAPSHOT: SNAPSHOT = open_snapshot(SNAPSHOT_PATH)
+        if not SNAPSHOT and subject_store().filled(): export_snapshot()
+        return SNAPSHOT
+
+# Writes levels of the store into a snapshot and switches over to it: the given (type, level) keys, or every filled
+# level if there are none. The other levels of the current snapshot are carried over without being decoded, so adding
+# a few levels never reads the rest of the catalog out of the store.
+def export_snapshot(path: str = SNAPSHOT_PATH, keys: list = None):
+    global SNAPSHOT
+    if keys is None: keys = subject_store().filled()
+    levels = {(type, level): [subject_fields(v) for v in subject_store().subjects(type, [level])] for type, level in keys}
+    with SNAPSHOT_LOCK:
+        merge_snapshot(path + '.tmp', SNAPSHOT, levels)
+        # The mapping has to be closed before the file underneath it can be replaced.
+        if SNAPSHOT and os.path.abspath(SNAPSHOT.path) == os.path.abspath(path):
+            SNAPSHOT.close()
+            SNAPSHOT = None
+        os.replace(path + '.tmp', path)
+        if path == SNAPSHOT_PATH: SNAPSHOT = open_snapshot(path)
+
+# Makes a snapshot exported elsewhere (e.g. on another machine) the one that is read from.
+def import_snapshot(path: str):
+    global SNAPSHOT
+    imported = open_snapshot(path)
+    if not imported: return False
+    imported.close()
+    with SNAPSHOT_LOCK:
+        if SNAPSHOT:
+            SNAPSHOT.close()
+            SNAPSHOT = None
+        if os.path.abspath(path) != os.path.abspath(SNAPSHOT_PATH): shutil.copyfile(path, SNAPSHOT_PATH)
+        SNAPSHOT = open_snapshot(SNAPSHOT_PATH)
+    return True
+
+def snapshot_items(type, level):
+    with SNAPSHOT_LOCK:
+        return [Item(*fields) for fields in current_snapshot().level(type, level)]
+
+# Downloads levels that are not in the store yet, yielding (level, raw subjects) for each level once it has been stored.
+def fill(type, levels):
+    if not levels: return
+    # Anything changed from now on is picked up by the next delta sync.
+    if not subject_store().sync_state(type):
+        subject_store().set_sync_state(type, timestamp(datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=SYNC_MARGIN)))
+    for level, subjects in fetch_levels_concurrent(type, levels):
+        subject_store().fill_level(type, level, subjects)
+        yield level, subjects
+
+# Yields the Items of every requested level one page at a time. Levels in the snapshot come first, straight out
+# of the mapped file, then levels that are only in the store, followed by the missing ones as soon as each arrives.
+# The delta sync only runs once everything already on disk has been yielded, so that it never holds up a quiz, and
+# what it changes is served from the next extraction on.
+# The levels that were read from the store, or stored while extracting, are added to the snapshot at the end, even
+# if the extraction failed or was cancelled halfway.
+def extract_pages(type, levels):
+    levels = list(levels)
+    snapshot = current_snapshot()
+    unsnapshotted = [level for level in levels if not (snapshot and snapshot.has_level(type, level))]
+    missing = subject_store().missing_levels(type, unsnapshotted)
+    stored = [level for level in unsnapshotted if level not in missing]
+    try:
+        for level in levels:
+            if level not in unsnapshotted: yield snapshot_items(type, level)
+            elif level not in missing: yield [json_to_obj(v) for v in subject_store().subjects(type, [level])]
+        try:
+            if sync(type):
+                export_snapshot()
+                stored = []
+        except LOAD_ERRORS as error:
+            print(f"Could not sync {type} subjects, using the stored ones: {error!r}")
+        for level, subjects in fill(type, missing):
+            stored.append(level)
+            yield [json_to_obj(v) for v in subjects]
+    finally:
+        if stored: export_snapshot(keys=[(type, level) for level in stored])
+
+# Yields the Items of every requested level one at a time.
+def extract_items(type, levels):
+    for page in extract_pages(type, levels):
+        yield from page
 
 def extract(type, levels):
-    vocabulary = []
-    for level in levels:
-        resource_path = 'subjects'
-        params = {'types': [type], 'levels': [level]}
-        response = requests.get(BASE + resource_path, params=params, headers=HEADERS).json()
-        data = response['data']
-        vocabulary += [json_to_obj(v) for v in data]
-    return vocabulary
\ No newline at end of file
+    return list(extract_items(type, levels))
+
+# The failures that end a load with an error instead of silently: the API, the network, malformed responses, and the local store.
+LOAD_ERRORS = (WaniKaniError, requests.RequestException, ValueError, KeyError, sqlite3.Error, OSError)
+
+# Runs extract_pages on a background thread, so that a caller can start using the first pages while later ones are still loading.
+# - on_page: An optional function called with every page on the loading thread, as soon as it arrives
+# - notify:  An optional function called on the loading thread whenever there is something new to receive, such as
+#            pygameblock.wake, so that a waiting application loop picks it up right away
+class PageLoader:
+    def __init__(self, type, levels, on_page = None, notify = None):
+        self.type = type
+        self.levels = list(levels)
+        self.on_page = on_page
+        self.notify = notify
+        self.pages = queue.Queue()
+        self.cancelled = threading.Event()
+        self.finished = False # Set once every page has been received
+        self.done = threading.Event() # Set once every page has been loaded
+        self.error = None
+        threading.Thread(target=self.run, args=(type, self.levels), daemon=True).start()
+
+    def matches(self, type, levels):
+        return self.type == type and self.levels == list(levels) and not self.cancelled.is_set()
+
+    def run(self, type, levels):
+        try:
+            for page in extract_pages(type, levels):
+                if self.cancelled.is_set(): return
+                if self.on_page: self.on_page(page)
+                self.pages.put(page)
+                if self.notify: self.notify()
+        except LOAD_ERRORS as error:
+            print(f"Could not load {type} levels {levels}: {error!r}")
+            self.pages.put(error)
+        finally:
+            self.pages.put(None)
+            self.done.set()
+            if self.notify: self.notify()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    # Returns the pages that have arrived since the last call, without blocking.
+    def receive(self):
+        pages = []
+        while not self.finished:
+            try:
+                page = self.pages.get_nowait()
+            except queue.Empty:
+                break
+            if page is None: self.finished = True
+            elif isinstance(page, Exception): self.error = page
+            else: pages.append(page)
+        return pages